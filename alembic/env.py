@@ -9,6 +9,8 @@ from alembic import context
 
 # Добавляем путь к вашему проекту в PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Общие шаги миграций (migration_helpers) лежат рядом с env.py
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Импортируем Base из вашего database.py
 from database import Base
@@ -28,6 +30,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
@@ -41,8 +44,12 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # Отдельная транзакция на каждую ревизию: autocommit_block() внутри
+        # миграции фиксирует только её собственные изменения
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
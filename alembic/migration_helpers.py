@@ -0,0 +1,69 @@
+"""Общие шаги миграций.
+
+Модуль лежит рядом с env.py, который добавляет этот каталог в sys.path;
+ревизии импортируют его как migration_helpers.
+"""
+from typing import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+# Сколько раз пересобирать индекс, если во время сборки появились дубликаты
+UNIQUE_INDEX_ATTEMPTS = 3
+
+
+def _drop_invalid_index(name: str) -> None:
+    """Удаляет индекс текущей схемы, оставшийся INVALID после сбоя CONCURRENTLY-сборки."""
+    op.execute(
+        "DO $$ BEGIN "
+        "IF EXISTS (SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        f"WHERE c.relname = '{name}' "
+        "AND c.relnamespace = current_schema()::regnamespace "
+        "AND NOT i.indisvalid) THEN "
+        f"DROP INDEX {name}; END IF; END $$"
+    )
+
+
+def _remove_duplicates(table: str, pk: str, columns: Sequence[str], keep_latest: bool) -> None:
+    """Удаляет строки с повторяющимися значениями columns, оставляя одну на группу."""
+    match = " AND ".join(f"a.{c} = b.{c}" for c in columns)
+    op.execute(
+        f"DELETE FROM {table} a USING {table} b "
+        f"WHERE {match} AND a.{pk} {'<' if keep_latest else '>'} b.{pk}"
+    )
+
+
+def create_unique_index_concurrently(
+    name: str,
+    table: str,
+    pk: str,
+    columns: Sequence[str],
+    keep_latest: bool = False
+) -> None:
+    """Строит уникальный индекс без блокировки записи, предварительно убрав дубликаты.
+
+    Дубликаты удаляются непосредственно перед CREATE UNIQUE INDEX CONCURRENTLY.
+    Если строка-дубликат успела появиться во время сборки, индекс остается
+    INVALID; тогда он удаляется, дубликаты чистятся снова и сборка повторяется
+    до UNIQUE_INDEX_ATTEMPTS раз. Вызывается вне транзакции миграции.
+
+    Args:
+        name (str): Имя индекса
+        table (str): Таблица
+        pk (str): Первичный ключ, по которому выбирается оставляемая строка
+        columns (Sequence[str]): Колонки индекса
+        keep_latest (bool): Оставлять самую позднюю строку вместо самой ранней
+    """
+    with op.get_context().autocommit_block():
+        for attempt in range(UNIQUE_INDEX_ATTEMPTS):
+            _drop_invalid_index(name)
+            _remove_duplicates(table, pk, columns, keep_latest)
+            try:
+                op.execute(
+                    f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                    f"ON {table} ({', '.join(columns)})"
+                )
+                return
+            except sa.exc.IntegrityError:
+                if attempt == UNIQUE_INDEX_ATTEMPTS - 1:
+                    raise
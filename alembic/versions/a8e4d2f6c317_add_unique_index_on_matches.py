@@ -0,0 +1,37 @@
+"""Add unique index on matches (user_id, matched_user_id)
+
+Revision ID: a8e4d2f6c317
+Revises: f5c2a7e9b184
+Create Date: 2026-10-14 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from migration_helpers import create_unique_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e4d2f6c317'
+down_revision: Union[str, Sequence[str], None] = 'f5c2a7e9b184'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = 'ix_matches_user_matched'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Кэш кандидатов пополнялся проверкой в приложении; при дубликатах
+    # оставляем последнюю запись — в ней самые свежие оценка и фото
+    create_unique_index_concurrently(
+        INDEX_NAME, 'matches', 'match_id', ('user_id', 'matched_user_id'),
+        keep_latest=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
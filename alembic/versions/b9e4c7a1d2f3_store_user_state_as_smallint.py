@@ -0,0 +1,243 @@
+"""Store users.state as SMALLINT ordinals
+
+Revision ID: b9e4c7a1d2f3
+Revises: a571ff604d1f
+Create Date: 2026-10-14 11:00:00.000000
+
+"""
+import time
+from typing import Callable, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9e4c7a1d2f3'
+down_revision: Union[str, Sequence[str], None] = 'a571ff604d1f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Снимок BotState на момент этой ревизии. Миграция не импортирует
+# utils.states: новые состояния добавляются отдельной ревизией, которая
+# пересоздает ck_users_state, а эта должна давать ту же схему, что и раньше
+STATES = {
+    'MAIN_MENU': 0,
+    'SEARCHING': 1,
+    'VIEWING_CANDIDATE': 2,
+    'FAVORITES': 3,
+    'SEARCH_SETTINGS': 4,
+    'PRIORITY_SETTINGS': 5,
+    'AUTH_IN_PROGRESS': 6,
+    'AWAITING_MIN_AGE': 7,
+    'AWAITING_MAX_AGE': 8,
+    'AWAITING_CITY': 9,
+}
+TO_ORDINAL = " ".join(f"WHEN '{name}' THEN {value}" for name, value in STATES.items())
+TO_NAME = " ".join(f"WHEN {value} THEN '{name}'" for name, value in STATES.items())
+STATE_VALUES = ", ".join(str(value) for value in STATES.values())
+DEFAULT_STATE = str(STATES['MAIN_MENU'])
+
+# Размер пачки при заполнении новой колонки
+BATCH_SIZE = 10000
+
+# Ограничения ожидания для DDL под AccessExclusiveLock
+LOCK_TIMEOUT = '3s'
+STATEMENT_TIMEOUT = '5min'
+LOCK_RETRIES = 6
+
+
+# Функция и триггер, переносящие изменения state в state_new во время заполнения
+SYNC_FUNCTION = 'users_state_new_sync'
+SYNC_TRIGGER = 'users_state_new_sync'
+
+
+def _to_ordinal(column: str) -> str:
+    """Возвращает SQL-выражение перевода текстового состояния в порядковый номер."""
+    return f"CASE upper({column}::text) {TO_ORDINAL} ELSE {DEFAULT_STATE} END"
+
+
+TO_ORDINAL_EXPR = _to_ordinal('state')
+
+
+def _create_sync_trigger() -> None:
+    """Создает триггер, заполняющий state_new при каждой записи state.
+
+    Строки, вставленные или измененные во время пакетного заполнения,
+    сразу получают верный state_new; пачкам остаются только строки,
+    где state_new еще NULL.
+    """
+    op.execute(
+        f"CREATE OR REPLACE FUNCTION {SYNC_FUNCTION}() RETURNS trigger AS $$ "
+        f"BEGIN NEW.state_new := {_to_ordinal('NEW.state')}; RETURN NEW; END "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(f"DROP TRIGGER IF EXISTS {SYNC_TRIGGER} ON users")
+    op.execute(
+        f"CREATE TRIGGER {SYNC_TRIGGER} BEFORE INSERT OR UPDATE OF state ON users "
+        f"FOR EACH ROW EXECUTE FUNCTION {SYNC_FUNCTION}()"
+    )
+
+
+def _add_state_new_column() -> None:
+    """Добавляет пустую колонку state_new и триггер ее синхронизации.
+
+    Оба шага берут AccessExclusiveLock на users, поэтому выполняются
+    вместе, одним шагом под lock_timeout.
+    """
+    op.add_column('users', sa.Column('state_new', sa.SmallInteger(), nullable=True))
+    _create_sync_trigger()
+
+
+def _backfill_state() -> None:
+    """Заполняет users.state_new короткими транзакциями по BATCH_SIZE строк.
+
+    Каждая пачка коммитится отдельно и держит блокировки только на своих
+    строках, вместо одной перезаписи всей таблицы под AccessExclusiveLock.
+    Частичный индекс по незаполненным строкам остается до замены колонок:
+    по нему _swap_state_columns находит строки, пропущенные пачками.
+    """
+    set_ordinal = f"SET state_new = {TO_ORDINAL_EXPR}"
+
+    if op.get_context().as_sql:
+        # В offline-режиме (--sql) число обновленных строк неизвестно
+        op.execute(f"UPDATE users {set_ordinal}")
+        return
+
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_state_tmp "
+            "ON users (user_id) WHERE state_new IS NULL"
+        )
+        batch = sa.text(
+            f"UPDATE users {set_ordinal} WHERE user_id IN ("
+            "SELECT user_id FROM users WHERE state_new IS NULL "
+            "ORDER BY user_id LIMIT :batch_size)"
+        )
+        while bind.execute(batch, {"batch_size": BATCH_SIZE}).rowcount:
+            pass
+
+
+def _state_column_type() -> str:
+    """Возвращает тип колонки users.state по information_schema."""
+    return op.get_bind().execute(sa.text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() "
+        "AND table_name = 'users' AND column_name = 'state'"
+    )).scalar()
+
+
+def _is_small_table() -> bool:
+    """Проверяет, что в users не больше BATCH_SIZE строк (без полного count)."""
+    return op.get_bind().execute(sa.text(
+        "SELECT count(*) <= :batch_size FROM "
+        "(SELECT 1 FROM users LIMIT :batch_size + 1) AS sample"
+    ), {"batch_size": BATCH_SIZE}).scalar()
+
+
+def _convert_in_place() -> None:
+    """Меняет тип колонки одним ALTER ... USING (одна перезапись таблицы)."""
+    op.alter_column('users', 'state',
+               existing_type=sa.String(length=50),
+               type_=sa.SmallInteger(),
+               postgresql_using=TO_ORDINAL_EXPR,
+               nullable=False,
+               server_default=DEFAULT_STATE)
+
+
+def _with_lock_timeout(step: Callable[[], None]) -> None:
+    """Выполняет DDL-шаг с lock_timeout, повторяя его с экспоненциальной паузой.
+
+    Шаг идет в отдельной точке сохранения: при таймауте блокировки
+    откатывается только он, а транзакция миграции остается рабочей.
+    """
+    def run() -> None:
+        op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        op.execute(f"SET LOCAL statement_timeout = '{STATEMENT_TIMEOUT}'")
+        step()
+
+    if op.get_context().as_sql:
+        run()
+        return
+
+    bind = op.get_bind()
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with bind.begin_nested():
+                run()
+            return
+        except sa.exc.OperationalError as e:
+            if 'lock timeout' not in str(e) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def _swap_state_columns() -> None:
+    """Заменяет старую колонку state заполненной state_new.
+
+    Изменения state во время заполнения уже перенес триггер, поэтому под
+    эксклюзивной блокировкой дозаполняются только строки, где state_new
+    еще NULL (их находит частичный индекс), до SET NOT NULL и удаления
+    старой колонки.
+    """
+    op.execute("LOCK TABLE users IN ACCESS EXCLUSIVE MODE")
+    op.execute(f"UPDATE users SET state_new = {TO_ORDINAL_EXPR} WHERE state_new IS NULL")
+    op.execute(f"DROP TRIGGER IF EXISTS {SYNC_TRIGGER} ON users")
+    op.execute(f"DROP FUNCTION IF EXISTS {SYNC_FUNCTION}()")
+    op.execute("DROP INDEX IF EXISTS ix_users_state_tmp")
+    op.drop_column('users', 'state')
+    op.alter_column('users', 'state_new',
+               new_column_name='state',
+               existing_type=sa.SmallInteger(),
+               nullable=False,
+               server_default=DEFAULT_STATE)
+
+
+def _replace_check_constraint() -> None:
+    """Пересоздает ограничение на допустимые значения users.state."""
+    # Таблицы, созданные старой моделью, хранили state в нативном ENUM;
+    # после конвертации тип не нужен, и драйверу не придется разбирать его OID
+    op.execute("DROP TYPE IF EXISTS bot_state")
+
+    op.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS ck_users_state")
+    op.create_check_constraint(
+        'ck_users_state', 'users', f"state IN ({STATE_VALUES})"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Состояние хранится как SMALLINT (2 байта на строку) вместо текста;
+    # неизвестные и пустые значения сбрасываются в MAIN_MENU
+    online = not op.get_context().as_sql
+    if online and _state_column_type() == 'smallint':
+        # Таблица создана по текущей модели — перезаписывать нечего
+        pass
+    elif online and _is_small_table():
+        _with_lock_timeout(_convert_in_place)
+    else:
+        _with_lock_timeout(_add_state_new_column)
+        _backfill_state()
+        _with_lock_timeout(_swap_state_columns)
+
+    _with_lock_timeout(_replace_check_constraint)
+    # Частичный индекс по «активным» состояниям: MAIN_MENU — самое
+    # частое значение, и индексировать его не нужно
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_state_active "
+            f"ON users (state) WHERE state <> {DEFAULT_STATE}"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_state_active")
+    op.add_column('users', sa.Column('state_old', sa.String(length=50), nullable=True))
+    op.execute(f"UPDATE users SET state_old = CASE state {TO_NAME} END")
+    op.drop_column('users', 'state')
+    op.alter_column('users', 'state_old',
+               new_column_name='state',
+               existing_type=sa.String(length=50))
@@ -0,0 +1,44 @@
+"""Add composite unique indexes for blacklist, favorites and photo likes
+
+Revision ID: c4d8e2a7b913
+Revises: b9e4c7a1d2f3
+Create Date: 2026-10-14 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from migration_helpers import create_unique_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d8e2a7b913'
+down_revision: Union[str, Sequence[str], None] = 'b9e4c7a1d2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, первичный ключ, колонки индекса)
+INDEXES = (
+    ('ix_blacklist_user_blocked', 'blacklist', 'block_id',
+     ('user_id', 'blocked_user_id')),
+    ('ix_favorites_user_favorite', 'favorites', 'favorite_id',
+     ('user_id', 'favorite_user_id')),
+    ('ix_photo_likes_user_photo', 'photo_likes', 'like_id',
+     ('user_id', 'photo_owner_id', 'photo_id')),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # До появления индексов дубликаты отсекались только проверкой в приложении;
+    # оставляем самую раннюю запись
+    for name, table, pk, columns in INDEXES:
+        create_unique_index_concurrently(name, table, pk, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _, _, _ in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,42 @@
+"""Convert matches.photos to jsonb
+
+Revision ID: d7a3f9c1e245
+Revises: c4d8e2a7b913
+Create Date: 2026-10-14 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3f9c1e245'
+down_revision: Union[str, Sequence[str], None] = 'c4d8e2a7b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Раньше список фотографий сохранялся через json.dumps, и в колонке
+# лежала JSON-строка с JSON внутри — такие значения разворачиваются
+TO_JSONB = (
+    "CASE WHEN json_typeof(photos) = 'string' "
+    "THEN (photos #>> '{}')::jsonb ELSE photos::jsonb END"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('matches', 'photos',
+               existing_type=sa.JSON(),
+               type_=postgresql.JSONB(),
+               postgresql_using=TO_JSONB)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('matches', 'photos',
+               existing_type=postgresql.JSONB(),
+               type_=sa.JSON(),
+               postgresql_using='photos::json')
@@ -0,0 +1,36 @@
+"""Add unique index on auth_states.user_id
+
+Revision ID: e1b6c8d4a392
+Revises: d7a3f9c1e245
+Create Date: 2026-10-14 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from migration_helpers import create_unique_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1b6c8d4a392'
+down_revision: Union[str, Sequence[str], None] = 'd7a3f9c1e245'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = 'ix_auth_states_user_id'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # save_verifier удалял прежние записи пользователя, но без ограничения
+    # дубликаты возможны; оставляем самую позднюю попытку входа
+    create_unique_index_concurrently(
+        INDEX_NAME, 'auth_states', 'id', ('user_id',), keep_latest=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
@@ -0,0 +1,37 @@
+"""Tune autovacuum for auth_states
+
+Revision ID: f5c2a7e9b184
+Revises: e1b6c8d4a392
+Create Date: 2026-10-14 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5c2a7e9b184'
+down_revision: Union[str, Sequence[str], None] = 'e1b6c8d4a392'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица маленькая, но почти каждая строка живет 10 минут: без
+    # агрессивной очистки мертвые версии строк раздувают ее и индексы
+    op.execute(
+        "ALTER TABLE auth_states SET ("
+        "autovacuum_vacuum_scale_factor = 0.01, "
+        "autovacuum_analyze_scale_factor = 0.02)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "ALTER TABLE auth_states RESET ("
+        "autovacuum_vacuum_scale_factor, "
+        "autovacuum_analyze_scale_factor)"
+    )
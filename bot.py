@@ -1,7 +1,5 @@
-import os
-from dotenv import load_dotenv
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
-from vk_api import VkApi, exceptions
+from vk_api import VkApi, VkRequestsPool, exceptions
 from utils.keyboard import (
     get_main_keyboard, 
     get_candidate_keyboard,
@@ -11,24 +9,27 @@ from utils.keyboard import (
     get_priority_settings_keyboard,
     get_gender_keyboard
 )
-from database import get_db
+from database import ScopedSession
 from database.crud import (
     get_user, 
     save_verifier, 
     get_verifier, 
     update_user_token, 
-    save_user_state, 
+    save_user_states, 
     get_user_state, 
     create_user,
-    get_favorites,
+    get_favorite_ids,
     remove_from_favorites,
-    like_photo,
-    unlike_photo,
+    bulk_like_photos,
+    bulk_unlike_photos,
+    has_liked_photos,
     add_to_favorites,
     add_to_blacklist,
     get_search_params,
+    get_or_create_search_params,
     update_search_params,
-    get_blacklist
+    get_blacklist_ids,
+    purge_expired_auth_states
 )
 from vkapi.auth import generate_auth_link, extract_auth_params, get_access_token, generate_state, validate_token
 from vkapi.methods import VKUserData, VKPhotos
@@ -36,11 +37,56 @@ from utils.matching import CandidateMatcher
 from config import Config
 import logging
 from utils.states import BotState
+from utils.cache import LRUDict, TTLCache
+from types import MappingProxyType
 from typing import Optional, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import heapq
+import threading
 import time
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Ограничения кэша данных пользователей в памяти
+USER_CACHE_SIZE = 10000
+MAX_CACHED_FAVORITES = 100
+
+# Сколько считать токен действительным после успешной проверки (секунды)
+TOKEN_VALIDATION_TTL = 3600
+
+# Команды возврата в меню, работающие в любом состоянии
+_MENU_WORDS = frozenset({'меню', 'начать', 'старт'})
+
+# Поля профиля, запрашиваемые при создании пользователя
+USER_INFO_FIELDS = "first_name,last_name,sex,city"
+
+# Время ожидания событий Bots Long Poll (максимум, допускаемый VK, секунды)
+LONGPOLL_WAIT = 90
+
+# Количество потоков для параллельной обработки событий
+EVENT_WORKERS = 16
+
+# Пауза перед повтором поиска при flood control (секунды)
+FLOOD_RETRY_DELAY = 10
+
+# Интервал накопления исходящих сообщений и размер очереди для немедленной отправки
+SEND_FLUSH_INTERVAL = 0.05
+SEND_BATCH_SIZE = 10
+
+# Интервал накопления изменений состояний перед записью в БД (секунды)
+STATE_FLUSH_INTERVAL = 0.2
+# Предельная пауза между повторами после ошибки записи состояний (секунды)
+STATE_FLUSH_MAX_DELAY = 30
+# Сколько сбросов (около 10 секунд) ждать строку пользователя, созданную в еще
+# не зафиксированной транзакции события, прежде чем отбросить его состояние
+STATE_MISSING_ROW_RETRIES = 50
+
+# Интервал удаления просроченных записей аутентификации (секунды)
+AUTH_PURGE_INTERVAL = 300
+
+# Заголовки списков избранного и черного списка
+_FAVORITES_HEADER = "⭐ Ваши избранные:\n\n"
+_BLACKLIST_HEADER = "🚫 Ваш черный список:\n"
+
 logger = logging.getLogger(__name__)
 
 
@@ -52,14 +98,116 @@ class VKBot:
     и взаимодействует с базой данных.
     """
 
+    # Таблицы разбора кнопок: текст кнопки -> имя метода-обработчика
+    _MAIN_MENU_ACTIONS = {
+        '🔍 Найти пару': 'start_search',
+        '⭐ Избранное': 'show_favorites',
+        '⚙️ Настройки': 'show_search_settings',
+        '❌ Чёрный список': 'show_blacklist',
+        'ℹ️ Помощь': 'show_help'
+    }
+
+    # Действия с кандидатом: текст кнопки -> (метод, передавать ли ID кандидата)
+    _CANDIDATE_ACTIONS = {
+        '❤️ Лайк': ('like_candidate_photos', True),
+        '💔 Убрать лайк': ('unlike_candidate_photos', True),
+        '⭐ В избранное': ('add_to_favorites', True),
+        '✖️ В чёрный список': ('add_to_blacklist', True),
+        '➡️ Следующий': ('start_search', False),
+        '🏠 В меню': ('_show_main_menu', False)
+    }
+
+    _FAVORITES_ACTIONS = {
+        '👀 Посмотреть': 'view_favorite',
+        '🗑 Удалить': 'ask_favorite_to_remove',
+        '🔙 Назад': '_show_main_menu'
+    }
+
+    _SETTINGS_ACTIONS = {
+        '👶 Возраст от': '_ask_min_age',
+        '👴 Возраст до': '_ask_max_age',
+        '🏙 Город': '_ask_city',
+        '👫 Пол': '_ask_gender',
+        '📊 Приоритеты': '_show_priority_settings',
+        '✅ Готово': '_show_main_menu',
+        '🔙 Назад': '_show_main_menu'
+    }
+
+    # Обработчики по состоянию: (метод, передавать ли сессию БД, доп. аргументы)
+    _STATE_HANDLERS = MappingProxyType({
+        BotState.AWAITING_MIN_AGE: ('_process_age_input', True, ('min',)),
+        BotState.AWAITING_MAX_AGE: ('_process_age_input', True, ('max',)),
+        BotState.AWAITING_CITY: ('_process_city_input', True, ()),
+        BotState.MAIN_MENU: ('_handle_main_menu', False, ()),
+        BotState.VIEWING_CANDIDATE: ('_handle_candidate_actions', False, ()),
+        BotState.FAVORITES: ('_handle_favorites_actions', False, ()),
+        BotState.SEARCH_SETTINGS: ('_handle_settings_actions', False, ()),
+        BotState.PRIORITY_SETTINGS: ('_handle_priority_actions', True, ())
+    })
+
+    # Таблицы только для чтения: общие для всех вызовов и защищены от случайного изменения
+    _GENDER_MAP = MappingProxyType({
+        '👨 Мужской': 'male',
+        '👩 Женский': 'female',
+        '👥 Любой': 'any'
+    })
+
+    # Музыка и книги оцениваются в составе интересов (отдельных весов в
+    # SearchParams нет), поэтому оба варианта повышают interests_weight
+    _PRIORITY_MAP = MappingProxyType({
+        '🔢 Возраст важнее': MappingProxyType({'age_weight': 1.0, 'interests_weight': 0.7}),
+        '🎵 Музыка важнее': MappingProxyType({'interests_weight': 1.0, 'age_weight': 0.7}),
+        '📚 Книги важнее': MappingProxyType({'interests_weight': 1.0, 'age_weight': 0.7}),
+        '👥 Друзья важнее': MappingProxyType({'friends_weight': 1.0, 'age_weight': 0.7})
+    })
+
     def __init__(self):
         """Инициализация бота с загрузкой конфигурации"""
         self.config = Config()
         self.vk_session = None
         self.vk = None
         self.longpoll = None
-        self.user_cache = {}  # Кэш данных пользователей {user_id: {data}}
+        # Кэш данных пользователей {user_id: {data}} с вытеснением давно неактивных
+        self.user_cache = LRUDict(maxsize=USER_CACHE_SIZE)
+        # Ответы users.get: {(user_id, fields): user_info}
+        self._users_get_cache = TTLCache(maxsize=10000, ttl=300)
+        # Успешно проверенные токены: {user_id: token} на TOKEN_VALIDATION_TTL
+        self._valid_tokens = TTLCache(maxsize=USER_CACHE_SIZE, ttl=TOKEN_VALIDATION_TTL)
+        # Одна сессия БД на обработку события вместо новой на каждый вызов
+        self.db_session = ScopedSession
+        # Отложенная запись состояний: {user_id: BotState}
+        self._state_writebuf: Dict[int, BotState] = {}
+        self._writebuf_lock = threading.Lock()
+        # Сколько сбросов подряд у пользователя не нашлось строки в users
+        self._state_missing_rows: Dict[int, int] = {}
+        self._writebuf_event = threading.Event()
+        # Очередь исходящих сообщений, отправляемых пачками через execute
+        self._send_queue: List[Dict] = []
+        self._send_lock = threading.Lock()
+        # Держится на все время отправки: немедленная отправка ждет пачку,
+        # уже забранную из очереди другим потоком
+        self._sending = threading.RLock()
+        self._send_event = threading.Event()
+        # Данные обрабатываемого в потоке события: outbox — сообщения и
+        # states — состояния, передаваемые дальше только после фиксации его транзакции
+        self._event_local = threading.local()
+        # Отложенные повторы поиска: куча (время запуска, user_id)
+        self._retry_queue: List[tuple] = []
+        self._retry_cond = threading.Condition()
+        self._retry_stopped = False
+        # События разных пользователей обрабатываются параллельно,
+        # сообщения одного пользователя — строго по очереди
+        self._pool = ThreadPoolExecutor(max_workers=EVENT_WORKERS)
+        # Очереди только пользователей с событиями в работе: {user_id: deque[(обработчик, аргументы)]}.
+        # Очередь пользователя разбирает не больше одной задачи пула
+        self._user_events: Dict[int, deque] = {}
+        self._user_events_guard = threading.Lock()
         self._init_group_session()
+        threading.Thread(target=self._state_flusher, daemon=True).start()
+        threading.Thread(target=self._send_flusher, daemon=True).start()
+        self._retry_thread = threading.Thread(target=self._retry_worker, daemon=True)
+        self._retry_thread.start()
+        threading.Thread(target=self._auth_purger, daemon=True).start()
         
     def _init_group_session(self):
         """
@@ -70,55 +218,410 @@ class VKBot:
         try:
             self.vk_session = VkApi(token=self.config.VK_GROUP_TOKEN)
             self.vk = self.vk_session.get_api()
-            self.longpoll = VkBotLongPoll(self.vk_session, group_id=self.config.VK_GROUP_ID)
+            # Долгое ожидание сокращает число пустых ответов и переподключений
+            self.longpoll = VkBotLongPoll(
+                self.vk_session,
+                group_id=self.config.VK_GROUP_ID,
+                wait=LONGPOLL_WAIT
+            )
         except Exception as e:
-            logger.error(f"Ошибка инициализации сессии группы: {e}")
+            logger.error("Ошибка инициализации сессии группы: %s", e)
             raise
 
-    def handle_auth_flow(self, user_id: int, text: str) -> Optional[str]:
+    def _get_state(self, user_id: int) -> Optional[BotState]:
+        """
+        Возвращает текущее состояние пользователя.
+        
+        Состояние берется из кэша, к БД обращаемся только при промахе.
+        
+        Args:
+            user_id: ID пользователя VK
+            
+        Returns:
+            Optional[BotState]: Состояние пользователя или None
+        """
+        user_data = self.user_cache.setdefault(user_id, {})
+        if user_data.get('state') is None:
+            with self._writebuf_lock:
+                pending = self._state_writebuf.get(user_id)
+            user_data['state'] = (
+                pending if pending is not None
+                else get_user_state(self.db_session(), user_id)
+            )
+        return user_data['state']
+
+    def _set_state(self, user_id: int, state: BotState):
+        """
+        Запоминает состояние пользователя и ставит его в очередь на запись в БД.
+        
+        Внутри обработки события состояние попадает в очередь только после
+        фиксации ее транзакции.
+        
+        Args:
+            user_id: ID пользователя VK
+            state: Новое состояние
+        """
+        user_data = self.user_cache.setdefault(user_id, {})
+        if user_data.get('state') == state:
+            return
+        user_data['state'] = state
+        states = getattr(self._event_local, 'states', None)
+        if states is not None:
+            states[user_id] = state
+        else:
+            self._buffer_states({user_id: state})
+
+    def _buffer_states(self, states: Dict[int, BotState]):
+        """
+        Передает состояния фоновому потоку записи.
+        
+        Args:
+            states: Новые состояния по ID пользователя
+        """
+        if not states:
+            return
+        with self._writebuf_lock:
+            self._state_writebuf.update(states)
+        self._writebuf_event.set()
+
+    def _flush_states(self) -> bool:
+        """
+        Записывает накопленные состояния пользователей одним запросом.
+        
+        Незаписанные состояния возвращаются в буфер. Если строки
+        пользователя нет и после STATE_MISSING_ROW_RETRIES сбросов, состояние
+        отбрасывается: пользователь не зарегистрирован, и его состояние
+        живет только в user_cache, как и до записи.
+        
+        Returns:
+            bool: False, если запрос завершился ошибкой
+        """
+        with self._writebuf_lock:
+            states, self._state_writebuf = self._state_writebuf, {}
+            self._writebuf_event.clear()
+        if not states:
+            return True
+        try:
+            updated = save_user_states(self.db_session(), states)
+        finally:
+            self.db_session.remove()
+        
+        with self._writebuf_lock:
+            if updated is None:
+                retry = states
+            else:
+                retry = {}
+                for user_id, state in states.items():
+                    if user_id in updated:
+                        self._state_missing_rows.pop(user_id, None)
+                        continue
+                    misses = self._state_missing_rows.get(user_id, 0) + 1
+                    if misses > STATE_MISSING_ROW_RETRIES:
+                        self._state_missing_rows.pop(user_id, None)
+                        logger.debug("Нет строки пользователя %s, состояние не сохранено", user_id)
+                        continue
+                    self._state_missing_rows[user_id] = misses
+                    retry[user_id] = state
+            # Не затираем более свежие состояния, пришедшие во время записи
+            for user_id, state in retry.items():
+                self._state_writebuf.setdefault(user_id, state)
+            if self._state_writebuf:
+                # Повтор не ждет следующего _set_state
+                self._writebuf_event.set()
+        return updated is not None
+
+    def _state_flusher(self):
+        """
+        Фоновый поток: сбрасывает состояния в БД не чаще раза в STATE_FLUSH_INTERVAL.
+        
+        После ошибки записи пауза удваивается до STATE_FLUSH_MAX_DELAY.
+        """
+        delay = STATE_FLUSH_INTERVAL
+        while True:
+            self._writebuf_event.wait()
+            time.sleep(delay)
+            if self._flush_states():
+                delay = STATE_FLUSH_INTERVAL
+            else:
+                delay = min(delay * 2, STATE_FLUSH_MAX_DELAY)
+
+    def _auth_purger(self):
+        """Фоновый поток: раз в AUTH_PURGE_INTERVAL удаляет просроченные auth_states."""
+        while True:
+            time.sleep(AUTH_PURGE_INTERVAL)
+            try:
+                deleted = purge_expired_auth_states(self.db_session())
+                if deleted:
+                    logger.debug("Удалено просроченных auth_states: %d", deleted)
+            finally:
+                self.db_session.remove()
+
+    def _queue_send(self, **params):
+        """
+        Ставит сообщение в очередь на отправку через messages.send.
+        
+        Внутри обработки события сообщение откладывается до фиксации
+        ее транзакции.
+        
+        Args:
+            **params: Параметры messages.send
+        """
+        # None нельзя передать в execute, такие параметры просто опускаем
+        params = {k: v for k, v in params.items() if v is not None}
+        outbox = getattr(self._event_local, 'outbox', None)
+        if outbox is not None:
+            outbox.append((False, params))
+        else:
+            self._enqueue_send(params)
+
+    def _send_now(self, **params):
+        """
+        Отправляет сообщение сразу, минуя очередь.
+        
+        Внутри обработки события сообщение откладывается до фиксации
+        ее транзакции.
+        
+        Args:
+            **params: Параметры messages.send
+        """
+        outbox = getattr(self._event_local, 'outbox', None)
+        if outbox is not None:
+            outbox.append((True, params))
+        else:
+            self._send_direct(params)
+
+    def _enqueue_send(self, params: Dict):
+        """
+        Добавляет сообщение в очередь пакетной отправки.
+        
+        Args:
+            params: Параметры messages.send
+        """
+        with self._send_lock:
+            self._send_queue.append(params)
+        self._send_event.set()
+
+    def _send_direct(self, params: Dict):
+        """
+        Отправляет сообщение отдельным вызовом messages.send.
+        
+        Args:
+            params: Параметры messages.send
+        """
+        # Сначала отправляем уже поставленные в очередь, чтобы не нарушить порядок
+        with self._sending:
+            self._flush_sends()
+            self.vk.messages.send(**params)
+
+    def _deliver(self, outbox: List[tuple]):
+        """
+        Отправляет сообщения зафиксированного события в порядке их создания.
+        
+        Args:
+            outbox: Пары (отправлять ли сразу, параметры messages.send)
+        """
+        for now, params in outbox:
+            try:
+                if now:
+                    self._send_direct(params)
+                else:
+                    self._enqueue_send(params)
+            except Exception as e:
+                logger.error(
+                    "Ошибка отправки сообщения пользователю %s: %s",
+                    params.get('user_id'), e
+                )
+
+    def _flush_sends(self):
+        """Отправляет накопленные сообщения пачками до 25 вызовов в одном execute."""
+        with self._sending:
+            with self._send_lock:
+                batch, self._send_queue = self._send_queue, []
+                self._send_event.clear()
+            if not batch:
+                return
+            try:
+                with VkRequestsPool(self.vk_session) as pool:
+                    results = [pool.method('messages.send', params) for params in batch]
+                for params, result in zip(batch, results):
+                    if not result.ok:
+                        logger.error(
+                            "Ошибка отправки сообщения пользователю %s: %s",
+                            params.get('user_id'), result.error
+                        )
+            except Exception as e:
+                logger.error("Ошибка пакетной отправки сообщений: %s", e)
+
+    def _send_flusher(self):
+        """Фоновый поток: отправляет очередь сообщений по таймеру или при заполнении."""
+        while True:
+            self._send_event.wait()
+            with self._send_lock:
+                queued = len(self._send_queue)
+            # Даем очереди накопиться, если она еще не заполнена
+            if queued < SEND_BATCH_SIZE:
+                time.sleep(SEND_FLUSH_INTERVAL)
+            self._flush_sends()
+
+    def _schedule_search_retry(self, user_id: int, delay: float = FLOOD_RETRY_DELAY):
+        """
+        Планирует повторный запуск поиска, не блокируя обработку других событий.
+        
+        Args:
+            user_id: ID пользователя VK
+            delay: Задержка перед повтором в секундах
+        """
+        with self._retry_cond:
+            heapq.heappush(self._retry_queue, (time.monotonic() + delay, user_id))
+            self._retry_cond.notify()
+
+    def _retry_worker(self):
+        """Фоновый поток: запускает отложенные повторы поиска по наступлении срока."""
+        while True:
+            with self._retry_cond:
+                while not self._retry_queue and not self._retry_stopped:
+                    self._retry_cond.wait()
+                if self._retry_stopped:
+                    return
+                due, user_id = self._retry_queue[0]
+                timeout = due - time.monotonic()
+                if timeout > 0:
+                    # Ждем срока или появления более раннего повтора
+                    self._retry_cond.wait(timeout)
+                    continue
+                heapq.heappop(self._retry_queue)
+            self._submit_event(user_id, self.start_search, user_id)
+
+    def _vk_users_get(self, user_id: int, fields: str) -> Dict:
+        """
+        Возвращает профиль пользователя из users.get, кэшируя ответ.
+        
+        Args:
+            user_id: ID пользователя VK
+            fields: Запрашиваемые поля через запятую
+            
+        Returns:
+            Dict: Данные пользователя
+        """
+        key = (user_id, fields)
+        user_info = self._users_get_cache.get(key, None)
+        if user_info is None:
+            user_info = self.vk.users.get(user_ids=user_id, fields=fields)[0]
+            self._users_get_cache.set(key, user_info)
+        return user_info
+
+    def _vk_users_names(self, user_ids: List[int]) -> Dict[int, str]:
+        """
+        Получает имена пользователей одним вызовом users.get на каждые 1000 ID.
+        
+        Args:
+            user_ids: Список ID пользователей VK
+            
+        Returns:
+            Dict[int, str]: Имя и фамилия по ID (пусто при ошибке запроса)
+        """
+        names = {}
+        try:
+            for i in range(0, len(user_ids), 1000):
+                for info in self.vk.users.get(user_ids=','.join(map(str, user_ids[i:i + 1000]))):
+                    names[info['id']] = f"{info.get('first_name', '')} {info.get('last_name', '')}".strip()
+        except Exception as e:
+            logger.warning("Не удалось получить имена пользователей: %s", e)
+        return names
+
+    @staticmethod
+    def _format_user_list(user_ids: List[int], names: Dict[int, str]) -> str:
+        """
+        Формирует нумерованный список пользователей.
+        
+        Args:
+            user_ids: ID пользователей в порядке вывода
+            names: Имена по ID (пользователи без имени выводятся по ID)
+            
+        Returns:
+            str: Строки вида «1. Имя Фамилия (id123)»
+        """
+        return "\n".join(
+            f"{i}. {names[uid]} (id{uid})" if names.get(uid) else f"{i}. id{uid}"
+            for i, uid in enumerate(user_ids, 1)
+        )
+
+    def _create_user_from_vk(self, db, user_id: int):
+        """
+        Создает пользователя по данным его профиля VK.
+        
+        Args:
+            db: Сессия базы данных
+            user_id: ID пользователя VK
+            
+        Returns:
+            Созданный пользователь или None при ошибке
+        """
+        user_info = self._vk_users_get(user_id, USER_INFO_FIELDS)
+        user_data = {
+            "user_id": user_id,
+            "first_name": user_info.get('first_name', ''),
+            "last_name": user_info.get('last_name', ''),
+            "gender": "female" if user_info.get('sex') == 1 else "male",
+            "city": user_info.get('city', {}).get('title') if isinstance(user_info.get('city'), dict) else None
+        }
+        return create_user(db, user_data, commit=False)
+
+    def _is_token_valid(self, user_id: int, token: str) -> bool:
+        """
+        Проверяет токен пользователя, обращаясь к VK не чаще раза в TOKEN_VALIDATION_TTL.
+        
+        Args:
+            user_id: ID пользователя VK
+            token: Токен доступа пользователя
+            
+        Returns:
+            bool: True если токен действителен
+        """
+        # Сравнение с сохраненным токеном: новый токен проверяется сразу
+        if self._valid_tokens.get(user_id) == token:
+            return True
+        if validate_token(token):
+            self._valid_tokens.set(user_id, token)
+            return True
+        self._valid_tokens.invalidate(user_id)
+        return False
+
+    def handle_auth_flow(self, user_id: int, text: str,
+                         folded: Optional[str] = None) -> Optional[str]:
         """
         Обработка потока авторизации пользователя.
         
         Args:
             user_id: ID пользователя VK
             text: Текст сообщения от пользователя
+            folded: Текст в нижнем регистре (casefold), если уже вычислен
             
         Returns:
             Optional[str]: Сообщение для отправки пользователю или None, если авторизация завершена
         """
-        text = text.strip()
-        db = next(get_db())
+        if folded is None:
+            text = text.strip()
+            folded = text.casefold()
+        db = self.db_session()
 
-        if text.lower() == "авторизоваться":
+        if folded == "авторизоваться":
             state = generate_state()
             auth_url, verifier = generate_auth_link(state)
             
-            if not save_verifier(db, user_id, verifier, state):
+            if not save_verifier(db, user_id, verifier, state, commit=False):
                 return "Ошибка при подготовке авторизации"
 
             # Создаём или обновляем пользователя
             user = get_user(db, user_id)
             if not user:
                 try:
-                    user_info = self.vk.users.get(
-                        user_ids=user_id,
-                        fields="first_name,last_name,sex,city"
-                    )[0]
-                    
-                    user_data = {
-                        "user_id": user_id,
-                        "first_name": user_info.get('first_name', ''),
-                        "last_name": user_info.get('last_name', ''),
-                        "gender": "female" if user_info.get('sex') == 1 else "male",
-                        "city": user_info.get('city', {}).get('title') if isinstance(user_info.get('city'), dict) else None,
-                        "state": BotState.AUTH_IN_PROGRESS.value
-                    }
-                    create_user(db, user_data)
+                    self._create_user_from_vk(db, user_id)
                 except Exception as e:
-                    logger.error(f"Ошибка создания пользователя: {e}")
+                    logger.error("Ошибка создания пользователя: %s", e)
                     return "Ошибка при создании профиля"
 
-            save_user_state(db, user_id, BotState.MAIN_MENU)
+            self._set_state(user_id, BotState.MAIN_MENU)
 
             return f"""Для работы бота необходимо предоставить доступ к вашему профилю VK.
 Пожалуйста, перейдите по ссылке для авторизации:
@@ -149,23 +652,18 @@ class VKBot:
             user = get_user(db, user_id)
             if not user:
                 try:
-                    user_info = self.vk.users.get(user_ids=user_id, fields="first_name,last_name")[0]
-                    user_data = {
-                        "user_id": user_id,
-                        "first_name": user_info.get('first_name', ''),
-                        "last_name": user_info.get('last_name', ''),
-                        "state": BotState.MAIN_MENU.value
-                    }
-                    create_user(db, user_data)
+                    self._create_user_from_vk(db, user_id)
                 except Exception as e:
-                    logger.error(f"Ошибка создания пользователя: {e}")
+                    logger.error("Ошибка создания пользователя: %s", e)
                     return "Ошибка создания профиля"
 
-            update_user_token(db, user_id, token)
-            save_user_state(db, user_id, BotState.MAIN_MENU)
+            update_user_token(db, user_id, token, commit=False)
+            self._valid_tokens.invalidate(user_id)
+            self._users_get_cache.invalidate((user_id, USER_INFO_FIELDS))
+            self._set_state(user_id, BotState.MAIN_MENU)
             
             # Отправляем сообщение с клавиатурой
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="✅ Авторизация успешна! Используйте меню:",
                 keyboard=get_main_keyboard(),
@@ -183,12 +681,12 @@ class VKBot:
             user_id: ID пользователя, для которого выполняется поиск
         """
         try:
-            db = next(get_db())
-            save_user_state(db, user_id, BotState.SEARCHING)
+            db = self.db_session()
+            self._set_state(user_id, BotState.SEARCHING)
             
             user = get_user(db, user_id)
-            if not user or not user.access_token or not validate_token(user.access_token):
-                self.vk.messages.send(
+            if not user or not user.access_token or not self._is_token_valid(user_id, user.access_token):
+                self._queue_send(
                     user_id=user_id,
                     message="❌ Требуется повторная авторизация. Напишите 'авторизоваться'",
                     random_id=0
@@ -196,7 +694,10 @@ class VKBot:
                 return
             
             if not get_search_params(db, user_id):
-                self._init_default_search_params(user_id)
+                get_or_create_search_params(
+                    db, user_id, lambda: self._default_search_params(user_id),
+                    commit=False
+                )
 
             matcher = CandidateMatcher(db, user_id, user.access_token)
             
@@ -204,32 +705,41 @@ class VKBot:
                 candidate = matcher.get_next_candidate()
             except exceptions.ApiError as e:
                 if e.code == 9:  # Flood control
-                    self.vk.messages.send(
+                    self._queue_send(
                         user_id=user_id,
                         message="⏳ Слишком много запросов. Подождите 10 секунд...",
                         random_id=0
                     )
-                    time.sleep(10)  # Ждём 10 секунд и пробуем снова
-                    candidate = matcher.get_next_candidate()
+                    # Повторим поиск позже, не задерживая остальных пользователей
+                    self._schedule_search_retry(user_id)
+                    return
+                elif e.code == 5:  # Ошибка авторизации: токен отозван или истек
+                    self._valid_tokens.invalidate(user_id)
+                    self._queue_send(
+                        user_id=user_id,
+                        message="❌ Требуется повторная авторизация. Напишите 'авторизоваться'",
+                        random_id=0
+                    )
+                    return
                 else:
                     raise e  # Если другая ошибка - пробрасываем дальше
             
             if not candidate:
-                self.vk.messages.send(
+                self._queue_send(
                     user_id=user_id,
                     message="😔 Не удалось найти подходящих кандидатов. Попробуйте изменить параметры поиска.",
                     keyboard=get_main_keyboard(),
                     random_id=0
                 )
-                save_user_state(db, user_id, BotState.MAIN_MENU)
+                self._set_state(user_id, BotState.MAIN_MENU)
                 return
             
-            self.user_cache[user_id] = {'current_candidate': candidate}
+            self.user_cache.setdefault(user_id, {})['current_candidate'] = candidate
             self.show_candidate(user_id, candidate)
             
         except Exception as e:
-            logger.error(f"Search error: {e}")
-            self.vk.messages.send(
+            logger.error("Search error: %s", e)
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Ошибка при поиске. Попробуйте изменить параметры.",
                 random_id=0
@@ -243,33 +753,22 @@ class VKBot:
             user_id: ID пользователя, которому показываем кандидата
             candidate: Данные кандидата
         """
-        db = next(get_db())
-        save_user_state(db, user_id, BotState.VIEWING_CANDIDATE)
+        db = self.db_session()
+        self._set_state(user_id, BotState.VIEWING_CANDIDATE)
         
-        # Проверяем лайки
-        has_liked = False  # Здесь можно добавить проверку из БД
+        # Проверяем, лайкнуты ли уже показываемые фотографии
+        photos = [(p['owner_id'], p['id']) for p in candidate.get('photos', [])[:3]]
+        has_liked = has_liked_photos(db, user_id, photos)
         
-        # Формируем сообщение
-        message = (
-            f"👤 {candidate.get('first_name', '')} {candidate.get('last_name', '')}\n"
-            f"🔗 Профиль: vk.com/{candidate.get('domain', '')}\n"
-            f"💯 Совпадение: {candidate.get('match_score', 0)*100:.0f}%"
-        )
-        
-        # Формируем вложения для фото
-        attachments = None
-        if candidate.get('photos'):
-            photo_attachments = []
-            for photo in candidate['photos']:
-                photo_attachments.append(f"photo{photo['owner_id']}_{photo['id']}")
-            attachments = ",".join(photo_attachments)
+        # Текст и вложения формируются один раз для кандидата
+        CandidateMatcher.prepare_display(candidate)
         
         # Отправляем сообщение
-        self.vk.messages.send(
+        self._queue_send(
             user_id=user_id,
-            message=message,
+            message=candidate['_message'],
             keyboard=get_candidate_keyboard(has_liked),
-            attachment=attachments,
+            attachment=candidate['_attachment_str'],
             random_id=0
         )
 
@@ -281,31 +780,28 @@ class VKBot:
             user_id: ID пользователя
         """
         try:
-            db = next(get_db())
-            save_user_state(db, user_id, BotState.FAVORITES)
+            db = self.db_session()
+            self._set_state(user_id, BotState.FAVORITES)
             
-            favorites = get_favorites(db, user_id)
+            favorites = get_favorite_ids(db, user_id)
             if not favorites:
-                self.vk.messages.send(
+                self._queue_send(
                     user_id=user_id,
                     message="⭐ Ваш список избранных пуст",
                     keyboard=get_main_keyboard(),
                     random_id=0
                 )
-                save_user_state(db, user_id, BotState.MAIN_MENU)
+                self._set_state(user_id, BotState.MAIN_MENU)
                 return
             
             # Формируем список избранных
-            message = "⭐ Ваши избранные:\n\n"
-            for i, fav in enumerate(favorites[:10], 1):
-                message += f"{i}. id{fav.favorite_user_id}\n"
+            shown = favorites[:10]
+            message = _FAVORITES_HEADER + self._format_user_list(shown, self._vk_users_names(shown))
             
             # Сохраняем избранных в кэш
-            if user_id not in self.user_cache:
-                self.user_cache[user_id] = {}
-            self.user_cache[user_id]['favorites'] = [f.favorite_user_id for f in favorites]
+            self.user_cache.setdefault(user_id, {})['favorites'] = favorites[:MAX_CACHED_FAVORITES]
             
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message=message,
                 keyboard=get_favorites_keyboard(),
@@ -313,8 +809,8 @@ class VKBot:
             )
             
         except Exception as e:
-            logger.error(f"Ошибка при показе избранных: {e}")
-            self.vk.messages.send(
+            logger.error("Ошибка при показе избранных: %s", e)
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Произошла ошибка при загрузке избранных",
                 random_id=0
@@ -329,14 +825,15 @@ class VKBot:
             index: Порядковый номер в списке избранных
         """
         try:
-            db = next(get_db())
-            if user_id not in self.user_cache or 'favorites' not in self.user_cache[user_id]:
+            db = self.db_session()
+            user_data = self.user_cache.get(user_id)
+            favorites = user_data.get('favorites') if user_data else None
+            if favorites is None:
                 self.show_favorites(user_id)
                 return
             
-            favorites = self.user_cache[user_id]['favorites']
             if index < 1 or index > len(favorites):
-                self.vk.messages.send(
+                self._queue_send(
                     user_id=user_id,
                     message="❌ Неверный номер избранного",
                     random_id=0
@@ -344,14 +841,14 @@ class VKBot:
                 return
             
             favorite_id = favorites[index-1]
-            if remove_from_favorites(db, user_id, favorite_id):
-                self.vk.messages.send(
+            if remove_from_favorites(db, user_id, favorite_id, commit=False):
+                self._queue_send(
                     user_id=user_id,
                     message=f"❌ Пользователь id{favorite_id} удален из избранных",
                     random_id=0
                 )
             else:
-                self.vk.messages.send(
+                self._queue_send(
                     user_id=user_id,
                     message=f"⚠️ Не удалось удалить пользователя id{favorite_id}",
                     random_id=0
@@ -361,13 +858,48 @@ class VKBot:
             self.show_favorites(user_id)
             
         except Exception as e:
-            logger.error(f"Ошибка при удалении из избранных: {e}")
-            self.vk.messages.send(
+            logger.error("Ошибка при удалении из избранных: %s", e)
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Произошла ошибка при удалении",
                 random_id=0
             )
 
+    def view_favorite(self, user_id: int):
+        """
+        Отправляет ссылки на профили из показанного списка избранных.
+        
+        Args:
+            user_id: ID пользователя
+        """
+        user_data = self.user_cache.get(user_id)
+        favorites = user_data.get('favorites') if user_data else None
+        if not favorites:
+            self.show_favorites(user_id)
+            return
+        
+        self._queue_send(
+            user_id=user_id,
+            message="\n".join(
+                f"{i}. https://vk.com/id{uid}" for i, uid in enumerate(favorites[:10], 1)
+            ),
+            keyboard=get_favorites_keyboard(),
+            random_id=0
+        )
+
+    def ask_favorite_to_remove(self, user_id: int):
+        """
+        Запрашивает номер избранного для удаления.
+        
+        Args:
+            user_id: ID пользователя
+        """
+        self._queue_send(
+            user_id=user_id,
+            message="Введите номер избранного для удаления:",
+            random_id=0
+        )
+
     def like_candidate_photos(self, user_id: int, candidate_id: int):
         """
         Ставит лайки на лучшие фото кандидата.
@@ -376,19 +908,16 @@ class VKBot:
             user_id: ID пользователя
             candidate_id: ID кандидата
         """
-        candidate = self.user_cache.get(user_id, {}).get('current_candidate')
+        user_data = self.user_cache.get(user_id)
+        candidate = user_data and user_data.get('current_candidate')
         if not candidate or not candidate.get('photos'):
             return
             
-        db = next(get_db())
-        liked = False
-        
-        for photo in candidate['photos'][:3]:
-            if like_photo(db, user_id, photo['owner_id'], photo['id']):
-                liked = True
+        db = self.db_session()
+        photos = [(p['owner_id'], p['id']) for p in candidate['photos'][:3]]
         
-        if liked:
-            self.vk.messages.send(
+        if bulk_like_photos(db, user_id, photos, commit=False):
+            self._queue_send(
                 user_id=user_id,
                 message="❤️ Лайки поставлены на лучшие фотографии!",
                 keyboard=get_candidate_keyboard(True),
@@ -403,19 +932,16 @@ class VKBot:
             user_id: ID пользователя
             candidate_id: ID кандидата
         """
-        candidate = self.user_cache.get(user_id, {}).get('current_candidate')
+        user_data = self.user_cache.get(user_id)
+        candidate = user_data and user_data.get('current_candidate')
         if not candidate or not candidate.get('photos'):
             return
             
-        db = next(get_db())
-        unliked = False
+        db = self.db_session()
+        photos = [(p['owner_id'], p['id']) for p in candidate['photos'][:3]]
         
-        for photo in candidate['photos'][:3]:
-            if unlike_photo(db, user_id, photo['owner_id'], photo['id']):
-                unliked = True
-        
-        if unliked:
-            self.vk.messages.send(
+        if bulk_unlike_photos(db, user_id, photos, commit=False):
+            self._queue_send(
                 user_id=user_id,
                 message="💔 Лайки убраны с фотографий",
                 keyboard=get_candidate_keyboard(False),
@@ -430,15 +956,15 @@ class VKBot:
             user_id: ID пользователя
             candidate_id: ID кандидата
         """
-        db = next(get_db())
-        if add_to_favorites(db, user_id, candidate_id):
-            self.vk.messages.send(
+        db = self.db_session()
+        if add_to_favorites(db, user_id, candidate_id, commit=False):
+            self._queue_send(
                 user_id=user_id,
                 message="⭐ Пользователь добавлен в избранное!",
                 random_id=0
             )
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Не удалось добавить в избранное",
                 random_id=0
@@ -452,9 +978,9 @@ class VKBot:
             user_id: ID пользователя
             candidate_id: ID кандидата
         """
-        db = next(get_db())
-        if add_to_blacklist(db, user_id, candidate_id):
-            self.vk.messages.send(
+        db = self.db_session()
+        if add_to_blacklist(db, user_id, candidate_id, commit=False):
+            self._queue_send(
                 user_id=user_id,
                 message="🚫 Пользователь добавлен в черный список",
                 random_id=0
@@ -462,7 +988,7 @@ class VKBot:
             # Переходим к следующему
             self.start_search(user_id)
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Не удалось добавить в черный список",
                 random_id=0
@@ -476,58 +1002,68 @@ class VKBot:
             user_id: ID пользователя
         """
         try:
-            db = next(get_db())
-            save_user_state(db, user_id, BotState.SEARCH_SETTINGS)
+            db = self.db_session()
+            self._set_state(user_id, BotState.SEARCH_SETTINGS)
             
-            params = get_search_params(db, user_id)
-            if not params:
-                self._init_default_search_params(user_id)
-                params = get_search_params(db, user_id)
-            
-            message = (
-                "🔧 Текущие настройки поиска:\n\n"
-                f"• Возраст: от {params.min_age} до {params.max_age}\n"
-                f"• Пол: {params.gender}\n"
-                f"• Город: {params.city or 'не указан'}\n"
-                f"• Только с фото: {'да' if params.has_photo else 'нет'}"
+            params = get_search_params(db, user_id) or get_or_create_search_params(
+                db, user_id, lambda: self._default_search_params(user_id),
+                commit=False
             )
             
-            self.vk.messages.send(
-                user_id=user_id,
-                message=message,
-                keyboard=get_search_settings_keyboard(),
-                random_id=0
-            )
+            self._render_search_settings(user_id, params)
             
         except Exception as e:
-            logger.error(f"Ошибка при показе настроек: {e}")
-            self.vk.messages.send(
+            logger.error("Ошибка при показе настроек: %s", e)
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Произошла ошибка при загрузке настроек",
                 random_id=0
             )
 
-    def _init_default_search_params(self, user_id: int):
+    def _render_search_settings(self, user_id: int, params):
         """
-        Инициализирует параметры поиска по умолчанию.
+        Отправляет пользователю уже загруженные настройки поиска.
         
         Args:
             user_id: ID пользователя
+            params: Параметры поиска (SearchParams)
         """
-        db = next(get_db())
-        user = get_user(db, user_id)
+        message = (
+            "🔧 Текущие настройки поиска:\n\n"
+            f"• Возраст: от {params.min_age} до {params.max_age}\n"
+            f"• Пол: {params.gender}\n"
+            f"• Город: {params.city or 'не указан'}\n"
+            f"• Только с фото: {'да' if params.has_photo else 'нет'}"
+        )
+        
+        self._queue_send(
+            user_id=user_id,
+            message=message,
+            keyboard=get_search_settings_keyboard(),
+            random_id=0
+        )
+
+    def _default_search_params(self, user_id: int) -> Optional[Dict]:
+        """
+        Формирует параметры поиска по умолчанию на основе профиля пользователя.
+        
+        Args:
+            user_id: ID пользователя
+            
+        Returns:
+            Optional[Dict]: Значения по умолчанию или None, если пользователь не найден
+        """
+        user = get_user(self.db_session(), user_id)
         if not user:
-            return
+            return None
             
-        default_params = {
+        return {
             "min_age": max(18, (user.age or 25) - 5),
             "max_age": (user.age or 25) + 5,
             "gender": "female" if user.gender == "male" else "male",
             "city": user.city,
             "has_photo": True
         }
-        
-        update_search_params(db, user_id, **default_params)
 
     def _ask_min_age(self, user_id: int):
         """
@@ -536,9 +1072,8 @@ class VKBot:
         Args:
             user_id: ID пользователя
         """
-        db = next(get_db())
-        save_user_state(db, user_id, BotState.AWAITING_MIN_AGE)
-        self.vk.messages.send(
+        self._set_state(user_id, BotState.AWAITING_MIN_AGE)
+        self._queue_send(
             user_id=user_id,
             message="Введите минимальный возраст для поиска (от 18):",
             keyboard=get_empty_keyboard(),
@@ -552,9 +1087,8 @@ class VKBot:
         Args:
             user_id: ID пользователя
         """
-        db = next(get_db())
-        save_user_state(db, user_id, BotState.AWAITING_MAX_AGE)
-        self.vk.messages.send(
+        self._set_state(user_id, BotState.AWAITING_MAX_AGE)
+        self._queue_send(
             user_id=user_id,
             message="Введите максимальный возраст для поиска (до 99):",
             keyboard=get_empty_keyboard(),
@@ -568,61 +1102,86 @@ class VKBot:
         Args:
             user_id: ID пользователя
         """
-        db = next(get_db())
-        save_user_state(db, user_id, BotState.AWAITING_CITY)
-        self.vk.messages.send(
+        self._set_state(user_id, BotState.AWAITING_CITY)
+        self._queue_send(
             user_id=user_id,
             message="Введите город для поиска:",
             keyboard=get_empty_keyboard(),
             random_id=0
         )
 
-    def handle_message(self, user_id: int, text: str):
+    def _ask_gender(self, user_id: int):
+        """
+        Предлагает выбрать пол для поиска.
+        
+        Выбор обрабатывается в состоянии SEARCH_SETTINGS, поэтому
+        отдельное состояние ожидания не нужно.
+        
+        Args:
+            user_id: ID пользователя
+        """
+        self._queue_send(
+            user_id=user_id,
+            message="Выберите пол для поиска:",
+            keyboard=get_gender_keyboard(),
+            random_id=0
+        )
+
+    def _show_priority_settings(self, user_id: int):
+        """
+        Отображает экран приоритетов поиска.
+        
+        Args:
+            user_id: ID пользователя
+        """
+        self._set_state(user_id, BotState.PRIORITY_SETTINGS)
+        self._queue_send(
+            user_id=user_id,
+            message="Выберите, что важнее при подборе:",
+            keyboard=get_priority_settings_keyboard(),
+            random_id=0
+        )
+
+    def handle_message(self, user_id: int, text: str, folded: Optional[str] = None):
         """
         Основной обработчик входящих сообщений.
         
         Args:
             user_id: ID пользователя
             text: Текст сообщения
+            folded: Текст в нижнем регистре (casefold), если уже вычислен
         """
-        db = next(get_db())
-        state = get_user_state(db, user_id)
-        
         # Обработка команд вне зависимости от состояния
-        if text.lower() in ['меню', 'начать', 'старт']:
+        if (folded if folded is not None else text.casefold()) in _MENU_WORDS:
             self._show_main_menu(user_id)
             return
         
-        # Обработка состояний ввода данных
-        if state == BotState.AWAITING_MIN_AGE:
-            self._process_age_input(user_id, text, 'min')
-            save_user_state(db, user_id, BotState.SEARCH_SETTINGS)
-            return
-        elif state == BotState.AWAITING_MAX_AGE:
-            self._process_age_input(user_id, text, 'max')
-            save_user_state(db, user_id, BotState.SEARCH_SETTINGS)
-            return
-        elif state == BotState.AWAITING_CITY:
-            self._process_city_input(user_id, text)
-            save_user_state(db, user_id, BotState.SEARCH_SETTINGS)
+        # Обработчик выбирается одним поиском по состоянию
+        # (новое состояние выставляют сами обработчики)
+        handler = self._STATE_HANDLERS.get(self._get_state(user_id))
+        if handler is None:
+            self._show_main_menu(user_id)
             return
         
-        # Обработка по состояниям
-        if state == BotState.MAIN_MENU:
-            self._handle_main_menu(user_id, text)
-        elif state == BotState.VIEWING_CANDIDATE:
-            self._handle_candidate_actions(user_id, text)
-        elif state == BotState.FAVORITES:
-            self._handle_favorites_actions(user_id, text)
-        elif state == BotState.SEARCH_SETTINGS:
-            self._handle_settings_actions(user_id, text)
-        elif state == BotState.PRIORITY_SETTINGS:
-            if text == '🔙 Назад':
-                self.show_search_settings(user_id)
-            else:
-                self._process_priority_selection(user_id, text)
+        method, with_db, extra_args = handler
+        if with_db:
+            getattr(self, method)(self.db_session(), user_id, text, *extra_args)
         else:
-            self._show_main_menu(user_id)
+            getattr(self, method)(user_id, text, *extra_args)
+
+    def _handle_priority_actions(self, db, user_id: int, text: str):
+        """
+        Обработчик действий на экране приоритетов поиска.
+        
+        Args:
+            db: Сессия базы данных
+            user_id: ID пользователя
+            text: Текст сообщения
+        """
+        if text == '🔙 Назад':
+            self.show_search_settings(user_id)
+        else:
+            self._process_priority_selection(db, user_id, text)
 
     def _handle_main_menu(self, user_id: int, text: str):
         """
@@ -632,18 +1191,11 @@ class VKBot:
             user_id: ID пользователя
             text: Текст сообщения
         """
-        if text == '🔍 Найти пару':
-            self.start_search(user_id)
-        elif text == '⭐ Избранное':
-            self.show_favorites(user_id)
-        elif text == '⚙️ Настройки':
-            self.show_search_settings(user_id)
-        elif text == '❌ Чёрный список':
-            self.show_blacklist(user_id)
-        elif text == 'ℹ️ Помощь':
-            self.show_help(user_id)
+        action = self._MAIN_MENU_ACTIONS.get(text)
+        if action:
+            getattr(self, action)(user_id)
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="ℹ️ Используйте кнопки меню",
                 random_id=0
@@ -657,25 +1209,21 @@ class VKBot:
             user_id: ID пользователя
             text: Текст сообщения
         """
-        candidate = self.user_cache.get(user_id, {}).get('current_candidate')
+        user_data = self.user_cache.get(user_id)
+        candidate = user_data and user_data.get('current_candidate')
         if not candidate:
             self.start_search(user_id)
             return
             
-        if text == '❤️ Лайк':
-            self.like_candidate_photos(user_id, candidate['id'])
-        elif text == '💔 Убрать лайк':
-            self.unlike_candidate_photos(user_id, candidate['id'])
-        elif text == '⭐ В избранное':
-            self.add_to_favorites(user_id, candidate['id'])
-        elif text == '✖️ В чёрный список':
-            self.add_to_blacklist(user_id, candidate['id'])
-        elif text == '➡️ Следующий':
-            self.start_search(user_id)
-        elif text == '🏠 В меню':
-            self._show_main_menu(user_id)
+        action = self._CANDIDATE_ACTIONS.get(text)
+        if action:
+            method, with_candidate = action
+            if with_candidate:
+                getattr(self, method)(user_id, candidate['id'])
+            else:
+                getattr(self, method)(user_id)
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="ℹ️ Используйте кнопки для взаимодействия с кандидатом",
                 random_id=0
@@ -689,18 +1237,15 @@ class VKBot:
             user_id: ID пользователя
             text: Текст сообщения
         """
-        if text == '👀 Посмотреть':
-            self.view_favorite(user_id)
-        elif text == '🗑 Удалить':
-            self.ask_favorite_to_remove(user_id)
-        elif text == '🔙 Назад':
-            self._show_main_menu(user_id)
+        action = self._FAVORITES_ACTIONS.get(text)
+        if action:
+            getattr(self, action)(user_id)
         else:
             # Попытка удалить по номеру
             if text.isdigit():
                 self.remove_favorite(user_id, int(text))
             else:
-                self.vk.messages.send(
+                self._queue_send(
                     user_id=user_id,
                     message="ℹ️ Используйте кнопки или номер для удаления",
                     random_id=0
@@ -714,22 +1259,14 @@ class VKBot:
             user_id: ID пользователя
             text: Текст сообщения
         """
-        if text == '👶 Возраст от':
-            self._ask_min_age(user_id)
-        elif text == '👴 Возраст до':
-            self._ask_max_age(user_id)
-        elif text == '🏙 Город':
-            self._ask_city(user_id)
-        elif text == '👫 Пол':
-            self._ask_gender(user_id)
-        elif text == '📊 Приоритеты':
-            self._show_priority_settings(user_id)
-        elif text == '✅ Готово':
-            self._show_main_menu(user_id)
-        elif text == '🔙 Назад':
-            self._show_main_menu(user_id)
+        action = self._SETTINGS_ACTIONS.get(text)
+        if action:
+            getattr(self, action)(user_id)
+        elif text in self._GENDER_MAP:
+            # Ответ на клавиатуру выбора пола из _ask_gender
+            self._process_gender_selection(self.db_session(), user_id, text)
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="ℹ️ Используйте кнопки для изменения настроек",
                 random_id=0
@@ -742,20 +1279,20 @@ class VKBot:
         Args:
             user_id: ID пользователя
         """
-        db = next(get_db())
-        save_user_state(db, user_id, BotState.MAIN_MENU)
-        self.vk.messages.send(
+        self._set_state(user_id, BotState.MAIN_MENU)
+        self._queue_send(
             user_id=user_id,
             message="Главное меню:",
             keyboard=get_main_keyboard(),
             random_id=0
         )
 
-    def _process_age_input(self, user_id: int, text: str, age_type: str):
+    def _process_age_input(self, db, user_id: int, text: str, age_type: str):
         """
         Обрабатывает ввод возраста.
         
         Args:
+            db: Сессия базы данных
             user_id: ID пользователя
             text: Введенный текст
             age_type: Тип возраста ('min' или 'max')
@@ -767,97 +1304,98 @@ class VKBot:
             elif age_type == 'max' and (age < 18 or age > 99):
                 raise ValueError("Возраст должен быть от 18 до 99")
                 
-            update_search_params(next(get_db()), user_id, **{f"{age_type}_age": age})
-            self.show_search_settings(user_id)  # Возвращаем в меню настроек
+            params = update_search_params(db, user_id, commit=False, **{f"{age_type}_age": age})
+            if not params:
+                raise ValueError("Не удалось сохранить возраст")
+            CandidateMatcher.reset_queue(user_id)
+            
+            # Возвращаем в меню настроек, используя уже обновленную строку
+            self._set_state(user_id, BotState.SEARCH_SETTINGS)
+            self._render_search_settings(user_id, params)
             
         except ValueError as e:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message=f"❌ {str(e)}. Попробуйте еще раз:",
                 keyboard=get_empty_keyboard(),
                 random_id=0
             )
             # Остаемся в состоянии ожидания ввода
-            save_user_state(next(get_db()), user_id, 
-                        BotState.AWAITING_MIN_AGE if age_type == 'min' 
-                        else BotState.AWAITING_MAX_AGE)
+            self._set_state(user_id,
+                            BotState.AWAITING_MIN_AGE if age_type == 'min'
+                            else BotState.AWAITING_MAX_AGE)
 
-    def _process_city_input(self, user_id: int, text: str):
+    def _process_city_input(self, db, user_id: int, text: str):
         """
         Обрабатывает ввод города.
         
         Args:
+            db: Сессия базы данных
             user_id: ID пользователя
             text: Введенный текст
         """
-        db = next(get_db())
-        try:
-            update_search_params(db, user_id, city=text)
-            self.show_search_settings(user_id)  # Возвращаем в меню настроек
-        except Exception as e:
-            logger.error(f"Error setting city: {e}")
-            self.vk.messages.send(
+        params = update_search_params(db, user_id, city=text, commit=False)
+        if params:
+            CandidateMatcher.reset_queue(user_id)
+            # Возвращаем в меню настроек, используя уже обновленную строку
+            self._set_state(user_id, BotState.SEARCH_SETTINGS)
+            self._render_search_settings(user_id, params)
+        else:
+            self._queue_send(
                 user_id=user_id,
                 message="❌ Ошибка при сохранении города. Попробуйте еще раз:",
                 keyboard=get_empty_keyboard(),
                 random_id=0
             )
-            save_user_state(db, user_id, BotState.AWAITING_CITY)
+            self._set_state(user_id, BotState.AWAITING_CITY)
 
-    def _process_gender_selection(self, user_id: int, text: str):
+    def _process_gender_selection(self, db, user_id: int, text: str):
         """
         Обрабатывает выбор пола.
         
         Args:
+            db: Сессия базы данных
             user_id: ID пользователя
             text: Выбранный вариант пола
         """
-        gender_map = {
-            '👨 Мужской': 'male',
-            '👩 Женский': 'female',
-            '👥 Любой': 'any'
-        }
-        
-        if text in gender_map:
-            update_search_params(next(get_db()), user_id, gender=gender_map[text])
-            self.vk.messages.send(
+        gender = self._GENDER_MAP.get(text)
+        if gender:
+            update_search_params(db, user_id, gender=gender, commit=False)
+            CandidateMatcher.reset_queue(user_id)
+            self._queue_send(
                 user_id=user_id,
                 message=f"✅ Пол для поиска установлен: {text}",
                 keyboard=get_search_settings_keyboard(),
                 random_id=0
             )
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="❌ Неверный выбор пола",
                 random_id=0
             )
 
-    def _process_priority_selection(self, user_id: int, text: str):
+    def _process_priority_selection(self, db, user_id: int, text: str):
         """
         Обрабатывает выбор приоритетов.
         
         Args:
+            db: Сессия базы данных
             user_id: ID пользователя
             text: Выбранный вариант приоритета
         """
-        priority_map = {
-            '🔢 Возраст важнее': {'age_weight': 1.0, 'interests_weight': 0.7},
-            '🎵 Музыка важнее': {'interests_weight': 1.0, 'age_weight': 0.7},
-            '📚 Книги важнее': {'interests_weight': 1.0, 'age_weight': 0.7},
-            '👥 Друзья важнее': {'friends_weight': 1.0, 'age_weight': 0.7}
-        }
-        
-        if text in priority_map:
-            update_search_params(next(get_db()), user_id, **priority_map[text])
-            self.vk.messages.send(
+        weights = self._PRIORITY_MAP.get(text)
+        if weights:
+            update_search_params(db, user_id, commit=False, **weights)
+            CandidateMatcher.reset_queue(user_id)
+            self._queue_send(
                 user_id=user_id,
                 message=f"✅ Приоритет установлен: {text}",
                 keyboard=get_priority_settings_keyboard(),
                 random_id=0
             )
         else:
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message="❌ Неверный выбор приоритета",
                 random_id=0
@@ -871,25 +1409,25 @@ class VKBot:
             user_id: ID пользователя
         """
         try:
-            db = next(get_db())
-            blacklist = get_blacklist(db, user_id)
+            db = self.db_session()
+            blacklist = get_blacklist_ids(db, user_id)
             
             if not blacklist:
                 message = "Ваш черный список пуст"
             else:
-                message = "🚫 Ваш черный список:\n" + "\n".join(
-                    [f"{i+1}. id{user.blocked_user_id}" for i, user in enumerate(blacklist)]
+                message = _BLACKLIST_HEADER + self._format_user_list(
+                    blacklist, self._vk_users_names(blacklist)
                 )
                 
-            self.vk.messages.send(
+            self._queue_send(
                 user_id=user_id,
                 message=message,
                 keyboard=get_main_keyboard(),
                 random_id=0
             )
         except Exception as e:
-            logger.error(f"Error showing blacklist: {e}")
-            self.vk.messages.send(
+            logger.error("Error showing blacklist: %s", e)
+            self._queue_send(
                 user_id=user_id,
                 message="⚠️ Ошибка при загрузке черного списка",
                 random_id=0
@@ -916,13 +1454,133 @@ class VKBot:
         - Пол
         - Приоритеты поиска
         """
-        self.vk.messages.send(
+        self._queue_send(
             user_id=user_id,
             message=help_text,
             keyboard=get_main_keyboard(),
             random_id=0
         )
 
+    def _handle_event(self, user_id: int, text: str):
+        """
+        Обрабатывает одно входящее сообщение в рамках общей сессии БД.
+        
+        Фиксацию транзакции и освобождение сессии выполняет _run_handler.
+        
+        Args:
+            user_id: ID пользователя
+            text: Текст сообщения
+        """
+        # Нормализуем текст один раз для всех обработчиков
+        text = text.strip()
+        folded = text.casefold()
+        
+        # Обработка авторизации
+        auth_response = self.handle_auth_flow(user_id, text, folded)
+        if auth_response:
+            self._send_now(
+                user_id=user_id,
+                message=auth_response,
+                random_id=0
+            )
+            return
+            
+        # Проверяем авторизацию пользователя
+        db = self.db_session()
+        user = get_user(db, user_id)
+        
+        if not user or not user.access_token:
+            self._queue_send(
+                user_id=user_id,
+                message="🔒 Для работы бота необходимо авторизоваться. Напишите 'авторизоваться'",
+                random_id=0
+            )
+            return
+            
+        # Обрабатываем сообщение
+        self.handle_message(user_id, text, folded)
+
+    def _submit_event(self, user_id: int, handler, *args):
+        """
+        Ставит обработчик в очередь пользователя.
+        
+        Если очередь пользователя уже разбирается, обработчик будет выполнен
+        той же задачей пула после предыдущих; иначе в пул отправляется новая.
+        Так события одного пользователя выполняются в порядке поступления,
+        а ожидающее событие не занимает поток пула.
+        
+        Args:
+            user_id: ID пользователя
+            handler: Вызываемый обработчик
+            *args: Аргументы обработчика
+        """
+        with self._user_events_guard:
+            queue = self._user_events.get(user_id)
+            if queue is not None:
+                queue.append((handler, args))
+                return
+            self._user_events[user_id] = deque([(handler, args)])
+        self._pool.submit(self._drain_user_events, user_id)
+
+    def _drain_user_events(self, user_id: int):
+        """
+        Выполняет события пользователя по очереди, пока она не опустеет.
+        
+        Args:
+            user_id: ID пользователя
+        """
+        while True:
+            with self._user_events_guard:
+                queue = self._user_events[user_id]
+                if not queue:
+                    # Пустая очередь удаляется, поэтому словарь не растет
+                    # с числом когда-либо писавших пользователей
+                    del self._user_events[user_id]
+                    return
+                handler, args = queue.popleft()
+            self._run_handler(user_id, handler, *args)
+
+    def _run_handler(self, user_id: int, handler, *args):
+        """
+        Выполняет обработчик события в одной транзакции.
+        
+        Сообщения и состояния обработчика передаются дальше только после
+        успешной фиксации; при откате состояния отбрасываются, а вместо
+        сообщений пользователь получает сообщение об ошибке.
+        
+        Args:
+            user_id: ID пользователя
+            handler: Вызываемый обработчик
+            *args: Аргументы обработчика
+        """
+        outbox = self._event_local.outbox = []
+        states = self._event_local.states = {}
+        try:
+            handler(*args)
+            # Все изменения обработчика фиксируются одной транзакцией
+            self.db_session.commit()
+        except Exception as e:
+            self.db_session.rollback()
+            logger.error("Ошибка обработки события пользователя %s: %s", user_id, e)
+            # Подтверждения откаченных изменений не отправляем
+            outbox = [(False, {
+                "user_id": user_id,
+                "message": "⚠️ Произошла ошибка, попробуйте еще раз",
+                "random_id": 0
+            })]
+            # Откатываем и состояния: при следующем обращении они
+            # перечитываются из буфера записи или БД
+            for uid in states:
+                self.user_cache.get(uid, {}).pop('state', None)
+            states = {}
+        finally:
+            self._event_local.outbox = self._event_local.states = None
+            self.db_session.remove()
+        # Сообщения и состояния уходят только после фиксации: ссылка авторизации
+        # не опережает сохранение ее state и verifier
+        self._buffer_states(states)
+        self._deliver(outbox)
+
     def run(self):
         """
         Основной цикл работы бота.
@@ -931,44 +1589,38 @@ class VKBot:
         """
         logger.info("Бот запущен и ожидает сообщений...")
         
-        while True:
-            try:
-                for event in self.longpoll.listen():
-                    if event.type == VkBotEventType.MESSAGE_NEW:
-                        user_id = event.obj.message['from_id']
-                        text = event.obj.message['text']
-                        
-                        # Обработка авторизации
-                        auth_response = self.handle_auth_flow(user_id, text)
-                        if auth_response:
-                            self.vk.messages.send(
-                                user_id=user_id,
-                                message=auth_response,
-                                random_id=0
-                            )
-                            continue
-                            
-                        # Проверяем авторизацию пользователя
-                        db = next(get_db())
-                        user = get_user(db, user_id)
-                        
-                        if not user or not user.access_token:
-                            self.vk.messages.send(
-                                user_id=user_id,
-                                message="🔒 Для работы бота необходимо авторизоваться. Напишите 'авторизоваться'",
-                                random_id=0
+        try:
+            while True:
+                try:
+                    for event in self.longpoll.listen():
+                        if event.type == VkBotEventType.MESSAGE_NEW:
+                            user_id = event.obj.message['from_id']
+                            self._submit_event(
+                                user_id,
+                                self._handle_event,
+                                user_id,
+                                event.obj.message['text']
                             )
-                            continue
                             
-                        # Обрабатываем сообщение
-                        self.handle_message(user_id, text)
-                        
-            except Exception as e:
-                logger.error(f"Ошибка в основном цикле бота: {e}")
-                if "connection" in str(e).lower():
-                    self._init_group_session()
+                except Exception as e:
+                    logger.error("Ошибка в основном цикле бота: %s", e)
+                    if "connection" in str(e).lower():
+                        self._init_group_session()
+        finally:
+            # Сначала останавливаем поток повторов, чтобы он не отправил
+            # задачу в уже закрытый пул; затем дожидаемся начатых обработчиков
+            # и не теряем несохраненные состояния
+            with self._retry_cond:
+                self._retry_stopped = True
+                self._retry_cond.notify_all()
+            self._retry_thread.join()
+            self._pool.shutdown(wait=True)
+            self._flush_sends()
+            self._flush_states()
 
 
 if __name__ == "__main__":
+    # Логирование настраивается только при запуске бота, а не при импорте модуля
+    logging.basicConfig(level=logging.INFO)
     bot = VKBot()
     bot.run()
@@ -1,6 +1,10 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
+ENV_PATH = '.env'
+"""Путь к файлу с переменными окружения"""
+
 # Загрузка переменных окружения из файла .env
 load_dotenv()
 
@@ -48,6 +52,29 @@ class Config:
     DB_URL = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
     """URL для подключения к базе данных"""
 
+    # Параметры пула соединений
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    """Количество постоянных соединений в пуле (по умолчанию 5)"""
+    
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '15'))
+    """Максимальное число временных соединений сверх пула (по умолчанию 15)"""
+    
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '10'))
+    """Время ожидания свободного соединения в секундах (по умолчанию 10)"""
+    
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+    """Время жизни соединения в секундах (по умолчанию 3600)"""
+
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '5000'))
+    """Максимальное время выполнения запроса в миллисекундах (по умолчанию 5000)"""
+    
+    DB_IDLE_IN_TRANSACTION_TIMEOUT = int(os.getenv('DB_IDLE_IN_TRANSACTION_TIMEOUT', '60000'))
+    """Время простоя открытой транзакции в миллисекундах до ее обрыва (по умолчанию 60000)"""
+
+    # Параметры подбора кандидатов
+    MATCH_TOP_CANDIDATES = int(os.getenv('MATCH_TOP_CANDIDATES', '100'))
+    """Сколько лучших кандидатов сохраняется по итогам одного поиска (по умолчанию 100)"""
+
     @staticmethod
     def update_env_var(key: str, value: str) -> None:
         """
@@ -59,19 +86,24 @@ class Config:
 
         Если переменная не существует, она будет добавлена в конец файла.
         """
-        with open('.env', 'r+') as f:
+        with open(ENV_PATH) as f:
             lines = f.readlines()
-            f.seek(0)
-            updated = False
-            
-            for line in lines:
-                if line.startswith(f'{key}='):
-                    f.write(f'{key}={value}\n')
-                    updated = True
-                else:
-                    f.write(line)
-            
-            if not updated:
-                f.write(f'{key}={value}\n')
-            
-            f.truncate()
+
+        prefix = f'{key}='
+        new_line = f'{key}={value}\n'
+        out = [new_line if line.startswith(prefix) else line for line in lines]
+        if new_line not in out:
+            if out and not out[-1].endswith('\n'):
+                out[-1] += '\n'
+            out.append(new_line)
+
+        # Запись во временный файл с атомарной заменой: при сбое .env
+        # остается в прежнем виде, а не обрезанным на середине
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(ENV_PATH)), prefix='.env.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(out)
+            os.replace(tmp_path, ENV_PATH)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
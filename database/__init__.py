@@ -4,19 +4,39 @@
 и фабрики сессий для работы с БД.
 """
 
+from contextlib import contextmanager
+import orjson
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from config import Config
 
 
+def _json_dumps(value) -> str:
+    """Сериализует значение JSON/JSONB-колонки через orjson."""
+    return orjson.dumps(value).decode()
+
+
 # Настройка подключения к PostgreSQL с пулом соединений
 engine = create_engine(
     Config.DB_URL,
-    pool_size=10,       # Количество постоянных соединений в пуле
-    max_overflow=20,    # Максимальное число временных соединений
-    pool_pre_ping=True, # Проверка активности соединений перед использованием
-    pool_recycle=3600   # Время жизни соединения (в секундах)
+    pool_size=Config.DB_POOL_SIZE,        # Количество постоянных соединений в пуле
+    max_overflow=Config.DB_MAX_OVERFLOW,  # Максимальное число временных соединений
+    pool_timeout=Config.DB_POOL_TIMEOUT,  # Ожидание свободного соединения (в секундах)
+    pool_recycle=Config.DB_POOL_RECYCLE,  # Время жизни соединения (в секундах)
+    pool_pre_ping=True,   # Проверка активности соединений перед использованием
+    pool_use_lifo=True,   # Переиспользуем «горячие» соединения, лишние закрываются в простое
+    query_cache_size=1200, # Размер кэша скомпилированных SQL-выражений
+    executemany_mode="values_plus_batch",  # Пакетные UPDATE/DELETE через execute_batch
+    json_serializer=_json_dumps,     # JSON-колонки (фото кандидатов) кодируются orjson
+    json_deserializer=orjson.loads,  # и разбираются им же при чтении
+    connect_args={
+        # Зависший запрос или брошенная транзакция не держат соединение пула
+        "options": (
+            f"-c statement_timeout={Config.DB_STATEMENT_TIMEOUT} "
+            f"-c idle_in_transaction_session_timeout={Config.DB_IDLE_IN_TRANSACTION_TIMEOUT}"
+        )
+    }
 )
 
 # Базовый класс для объявления моделей SQLAlchemy
@@ -29,22 +49,24 @@ SessionLocal = sessionmaker(
     expire_on_commit=False  # Отключение автоматического истечения сессии
 )
 
+# Сессия, общая для всех вызовов в пределах одного потока
+# (обработчик события бота, фоновые потоки). Освобождается через ScopedSession.remove()
+ScopedSession = scoped_session(SessionLocal)
+
 
+@contextmanager
 def get_db():
-    """Генератор сессий базы данных для использования в зависимостях.
+    """Контекстный менеджер сессии базы данных.
     
     Yields:
         Session: Объект сессии SQLAlchemy
     
     Примечание:
-        Автоматически закрывает соединение после завершения работы.
+        Закрывает сессию и возвращает соединение в пул сразу при выходе из блока.
     
     Пример использования:
-        db = next(get_db())
-        try:
+        with get_db() as db:
             # Работа с БД
-        finally:
-            db.close()
     """
     db = SessionLocal()
     try:
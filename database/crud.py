@@ -4,19 +4,170 @@
 пользователей, их настроек поиска, избранного и черного списка.
 """
 
+from sqlalchemy import bindparam, case, event, exists, inspect, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Tuple
-import json
+from types import SimpleNamespace
+from typing import Callable, FrozenSet, Optional, Dict, List, Tuple
 from . import models
 import logging
 from utils.states import BotState
+from utils.cache import (
+    TTLCache,
+    cached,
+    invalidate_after_transaction,
+    invalidates,
+    run_pending_invalidations
+)
 
 logger = logging.getLogger(__name__)
 
+# Множества ID из черного списка и избранного по пользователям.
+# Проверяются для каждого кандидата, поэтому держим их в памяти
+# и сбрасываем при любом изменении списков.
+_blacklist_cache = TTLCache(maxsize=4096, ttl=300)
+_favorites_cache = TTLCache(maxsize=4096, ttl=300)
+
+# Пользователь и его параметры поиска читаются почти на каждое сообщение;
+# записи сбрасываются при изменении данных через функции этого модуля.
+# В кэше лежат снимки значений (_snapshot), а не ORM-объекты: объект живой
+# сессии после ее отката и закрытия недоступен другим потокам
+_user_cache = TTLCache(maxsize=10000, ttl=60)
+_search_params_cache = TTLCache(maxsize=10000, ttl=60)
+
+# Часто выполняемые запросы строятся один раз при импорте; значения
+# подставляются через bindparam, а скомпилированный SQL берется из кэша движка
+_SELECT_USER = select(models.User).where(
+    models.User.user_id == bindparam("uid")
+)
+_SELECT_SEARCH_PARAMS = select(models.SearchParams).where(
+    models.SearchParams.user_id == bindparam("uid")
+)
+_SELECT_FAVORITES = select(models.Favorite).where(
+    models.Favorite.user_id == bindparam("uid")
+)
+_SELECT_FAVORITE_IDS = select(models.Favorite.favorite_user_id).where(
+    models.Favorite.user_id == bindparam("uid")
+)
+_SELECT_BLACKLIST_IDS = select(models.Blacklist.blocked_user_id).where(
+    models.Blacklist.user_id == bindparam("uid")
+)
+_SELECT_VERIFIER = select(models.AuthState.code_verifier).where(
+    models.AuthState.user_id == bindparam("uid"),
+    models.AuthState.state == bindparam("state"),
+    models.AuthState.expires_at > bindparam("now")
+).limit(1)
+_UPDATE_USER_STATE = update(models.User).where(
+    models.User.user_id == bindparam("uid")
+).values(
+    state=bindparam("state", type_=models.User.state.type)
+).returning(models.User.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _run_invalidations(session: Session) -> None:
+    """Повторно сбрасывает записи кэшей, измененные в завершенной транзакции.
+
+    После отката сброс тоже нужен: чтение внутри транзакции могло положить
+    в общий кэш снимок незафиксированной строки.
+    """
+    # События приходят и для SAVEPOINT (_savepoint): внешняя транзакция
+    # еще открыта, и сбрасывать кэши рано
+    if not session.in_nested_transaction():
+        run_pending_invalidations(session)
+
+
+def _snapshot(row) -> Optional[SimpleNamespace]:
+    """Копирует значения колонок записи в объект, не связанный с сессией.
+
+    Args:
+        row: Экземпляр модели или None
+
+    Returns:
+        Optional[SimpleNamespace]: Снимок с атрибутами-колонками модели
+    """
+    if row is None:
+        return None
+    return SimpleNamespace(**{
+        attr.key: getattr(row, attr.key) for attr in inspect(row).mapper.column_attrs
+    })
+
+
+def _commit(db: Session, commit: bool) -> None:
+    """Фиксирует транзакцию или, если commit=False, только сбрасывает изменения в БД."""
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+
+
+def _savepoint(db: Session, commit: bool):
+    """Возвращает контекст записи: SAVEPOINT при commit=False.
+
+    Функции с commit=False пишут в общую транзакцию события. При ошибке
+    откатывается только их SAVEPOINT, а изменения, уже сделанные
+    обработчиком, остаются и фиксируются вместе с транзакцией.
+
+    Args:
+        db (Session): Сессия базы данных
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        Контекстный менеджер вложенной транзакции или пустой контекст
+    """
+    return nullcontext() if commit else db.begin_nested()
+
+
+def _rollback(db: Session, commit: bool) -> None:
+    """Откатывает транзакцию после ошибки, если функция фиксировала ее сама.
+
+    При commit=False SAVEPOINT уже откатил _savepoint, а транзакцию
+    события завершает вызывающий код.
+    """
+    if commit:
+        db.rollback()
+
+
+def _insert_or_get(
+    db: Session,
+    model,
+    values: Dict,
+    index_elements: List[str],
+    commit: bool = True
+):
+    """Вставляет запись одним INSERT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Если такая запись уже есть (конфликт по уникальному индексу),
+    возвращает существующую отдельным SELECT.
 
-def create_user(db: Session, user_data: Dict) -> Optional[models.User]:
+    Args:
+        db (Session): Сессия базы данных
+        model: Класс модели
+        values (Dict): Значения колонок
+        index_elements (List[str]): Колонки уникального индекса
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        Созданная или существующая запись
+
+    Raises:
+        SQLAlchemyError: При ошибке базы данных
+    """
+    stmt = pg_insert(model).values(**values).on_conflict_do_nothing(
+        index_elements=index_elements
+    ).returning(model)
+    row = db.scalars(stmt).first()
+    _commit(db, commit)
+    if row is None:
+        row = db.query(model).filter_by(**values).first()
+    return row
+
+
+def create_user(db: Session, user_data: Dict, commit: bool = True) -> Optional[models.User]:
     """Создает нового пользователя в базе данных.
 
     Args:
@@ -29,32 +180,38 @@ def create_user(db: Session, user_data: Dict) -> Optional[models.User]:
             - gender (str): Пол ('male' или 'female')
             - city (Optional[str]): Город
             - access_token (Optional[str]): Токен доступа
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         Optional[models.User]: Созданный пользователь или None при ошибке
     """
+    # Чтение в той же транзакции кэширует снимок еще не зафиксированной строки;
+    # ключ — из user_data, поэтому вместо @invalidates сбрасываем явно
+    invalidate_after_transaction(db, _user_cache, user_data["user_id"])
     try:
-        db_user = models.User(
-            user_id=user_data["user_id"],
-            first_name=user_data["first_name"],
-            last_name=user_data["last_name"],
-            age=user_data.get("age"),
-            gender=user_data["gender"],
-            city=user_data.get("city"),
-            access_token=user_data.get("access_token"),
-            state="main_menu"
-        )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        return db_user
+        with _savepoint(db, commit):
+            db_user = models.User(
+                user_id=user_data["user_id"],
+                first_name=user_data["first_name"],
+                last_name=user_data["last_name"],
+                age=user_data.get("age"),
+                gender=user_data["gender"],
+                city=user_data.get("city"),
+                access_token=user_data.get("access_token"),
+                state=BotState.MAIN_MENU
+            )
+            db.add(db_user)
+            _commit(db, commit)
+            db.refresh(db_user)
+            return db_user
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка создания пользователя: {e}")
         return None
 
 
-def get_user(db: Session, user_id: int) -> Optional[models.User]:
+@cached(_user_cache)
+def get_user(db: Session, user_id: int) -> Optional[SimpleNamespace]:
     """Получает пользователя по ID ВКонтакте.
 
     Args:
@@ -62,15 +219,17 @@ def get_user(db: Session, user_id: int) -> Optional[models.User]:
         user_id (int): ID пользователя ВКонтакте
 
     Returns:
-        Optional[models.User]: Найденный пользователь или None
+        Optional[SimpleNamespace]: Снимок полей пользователя (только для чтения) или None
     """
-    return db.query(models.User).filter(models.User.user_id == user_id).first()
+    return _snapshot(db.execute(_SELECT_USER, {"uid": user_id}).scalar_one_or_none())
 
 
+@invalidates(_search_params_cache)
 def update_search_params(
     db: Session,
     user_id: int,
     interests: Optional[str] = None,
+    commit: bool = True,
     **kwargs
 ) -> Optional[models.SearchParams]:
     """Обновляет параметры поиска пользователя.
@@ -85,35 +244,39 @@ def update_search_params(
             - gender (str): Пол ('male', 'female', 'any')
             - city (str): Город
             - has_photo (bool): Только с фото
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         Optional[models.SearchParams]: Обновленные параметры или None при ошибке
     """
     try:
-        params = db.query(models.SearchParams).filter_by(user_id=user_id).first()
+        with _savepoint(db, commit):
+            params = db.query(models.SearchParams).filter_by(user_id=user_id).first()
         
-        if not params:
-            params = models.SearchParams(user_id=user_id, **kwargs)
-            db.add(params)
-        else:
-            for key, value in kwargs.items():
-                setattr(params, key, value)
+            if not params:
+                params = models.SearchParams(user_id=user_id, **kwargs)
+                db.add(params)
+            else:
+                for key, value in kwargs.items():
+                    setattr(params, key, value)
         
-        if interests is not None:
-            params.interests = interests
+            if interests is not None:
+                params.interests = interests
             
-        db.commit()
-        return params
+            _commit(db, commit)
+            return params
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка обновления параметров поиска: {e}")
         return None
 
 
+@invalidates(_favorites_cache)
 def add_to_favorites(
     db: Session,
     user_id: int,
-    favorite_user_id: int
+    favorite_user_id: int,
+    commit: bool = True
 ) -> Optional[models.Favorite]:
     """Добавляет пользователя в избранное.
 
@@ -121,36 +284,31 @@ def add_to_favorites(
         db (Session): Сессия базы данных
         user_id (int): ID пользователя, который добавляет
         favorite_user_id (int): ID добавляемого пользователя
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         Optional[models.Favorite]: Созданная запись или None при ошибке
     """
     try:
-        exists = db.query(models.Favorite).filter_by(
-            user_id=user_id,
-            favorite_user_id=favorite_user_id
-        ).first()
-        
-        if exists:
-            return exists
-            
-        fav = models.Favorite(
-            user_id=user_id,
-            favorite_user_id=favorite_user_id
-        )
-        db.add(fav)
-        db.commit()
-        return fav
+        with _savepoint(db, commit):
+            return _insert_or_get(
+                db, models.Favorite,
+                {"user_id": user_id, "favorite_user_id": favorite_user_id},
+                ["user_id", "favorite_user_id"],
+                commit=commit
+            )
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка добавления в избранное: {e}")
         return None
 
 
+@invalidates(_favorites_cache)
 def remove_from_favorites(
     db: Session,
     user_id: int,
-    favorite_user_id: int
+    favorite_user_id: int,
+    commit: bool = True
 ) -> bool:
     """Удаляет пользователя из избранного.
 
@@ -158,31 +316,31 @@ def remove_from_favorites(
         db (Session): Сессия базы данных
         user_id (int): ID пользователя
         favorite_user_id (int): ID удаляемого пользователя
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         bool: True если удаление прошло успешно, иначе False
     """
     try:
-        fav = db.query(models.Favorite).filter_by(
-            user_id=user_id,
-            favorite_user_id=favorite_user_id
-        ).first()
-        
-        if fav:
-            db.delete(fav)
-            db.commit()
-            return True
-        return False
+        with _savepoint(db, commit):
+            deleted = db.query(models.Favorite).filter_by(
+                user_id=user_id,
+                favorite_user_id=favorite_user_id
+            ).delete(synchronize_session=False)
+            _commit(db, commit)
+            return deleted > 0
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка удаления из избранного: {e}")
         return False
 
 
+@invalidates(_blacklist_cache)
 def add_to_blacklist(
     db: Session,
     user_id: int,
-    blocked_user_id: int
+    blocked_user_id: int,
+    commit: bool = True
 ) -> Optional[models.Blacklist]:
     """Добавляет пользователя в черный список.
 
@@ -190,28 +348,21 @@ def add_to_blacklist(
         db (Session): Сессия базы данных
         user_id (int): ID пользователя
         blocked_user_id (int): ID блокируемого пользователя
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         Optional[models.Blacklist]: Созданная запись или None при ошибке
     """
     try:
-        exists = db.query(models.Blacklist).filter_by(
-            user_id=user_id,
-            blocked_user_id=blocked_user_id
-        ).first()
-        
-        if exists:
-            return exists
-            
-        block = models.Blacklist(
-            user_id=user_id,
-            blocked_user_id=blocked_user_id
-        )
-        db.add(block)
-        db.commit()
-        return block
+        with _savepoint(db, commit):
+            return _insert_or_get(
+                db, models.Blacklist,
+                {"user_id": user_id, "blocked_user_id": blocked_user_id},
+                ["user_id", "blocked_user_id"],
+                commit=commit
+            )
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка добавления в черный список: {e}")
         return None
 
@@ -231,45 +382,152 @@ def is_in_blacklist(
     Returns:
         bool: True если пользователь в черном списке, иначе False
     """
-    return db.query(models.Blacklist).filter_by(
-        user_id=user_id,
-        blocked_user_id=candidate_id
-    ).first() is not None
+    return candidate_id in _load_blacklist(db, user_id)
+
+
+@cached(_blacklist_cache)
+def _load_blacklist(db: Session, user_id: int) -> FrozenSet[int]:
+    """Загружает ID заблокированных пользователей одним запросом (с кэшированием).
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+
+    Returns:
+        FrozenSet[int]: Множество ID заблокированных пользователей
+    """
+    return frozenset(db.execute(_SELECT_BLACKLIST_IDS, {"uid": user_id}).scalars())
 
 
-def cache_match(
+@invalidates(_blacklist_cache)
+def remove_from_blacklist(
     db: Session,
     user_id: int,
-    matched_user_id: int,
-    photos: List[Dict],
-    match_score: float = 0.0
-) -> Optional[models.Match]:
-    """Кэширует найденного кандидата.
+    blocked_user_id: int,
+    commit: bool = True
+) -> bool:
+    """Удаляет пользователя из черного списка.
 
     Args:
         db (Session): Сессия базы данных
         user_id (int): ID пользователя
-        matched_user_id (int): ID найденного кандидата
-        photos (List[Dict]): Список фотографий кандидата
-        match_score (float): Оценка совпадения (по умолчанию 0.0)
+        blocked_user_id (int): ID разблокируемого пользователя
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
-        Optional[models.Match]: Созданная запись или None при ошибке
+        bool: True если запись была удалена, иначе False
     """
     try:
-        match = models.Match(
-            user_id=user_id,
-            matched_user_id=matched_user_id,
-            photos=json.dumps(photos),
-            match_score=match_score
-        )
-        db.add(match)
-        db.commit()
-        return match
-    except (SQLAlchemyError, json.JSONDecodeError) as e:
-        db.rollback()
-        logger.error(f"Ошибка кэширования кандидата: {e}")
-        return None
+        with _savepoint(db, commit):
+            deleted = db.query(models.Blacklist).filter_by(
+                user_id=user_id,
+                blocked_user_id=blocked_user_id
+            ).delete(synchronize_session=False)
+            _commit(db, commit)
+            return deleted > 0
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка удаления из черного списка: {e}")
+        return False
+
+
+def is_in_favorites(
+    db: Session,
+    user_id: int,
+    candidate_id: int
+) -> bool:
+    """Проверяет, находится ли пользователь в избранном.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+        candidate_id (int): ID проверяемого пользователя
+
+    Returns:
+        bool: True если пользователь в избранном, иначе False
+    """
+    return candidate_id in _load_favorite_ids(db, user_id)
+
+
+@cached(_favorites_cache)
+def _load_favorite_ids(db: Session, user_id: int) -> FrozenSet[int]:
+    """Загружает ID избранных пользователей одним запросом (с кэшированием).
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+
+    Returns:
+        FrozenSet[int]: Множество ID избранных пользователей
+    """
+    return frozenset(db.execute(_SELECT_FAVORITE_IDS, {"uid": user_id}).scalars())
+
+
+def get_excluded_ids(db: Session, user_id: int) -> FrozenSet[int]:
+    """Возвращает ID пользователей, которых не нужно показывать в поиске.
+
+    Объединяет черный список и избранное (оба читаются из кэша).
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+
+    Returns:
+        FrozenSet[int]: ID заблокированных и избранных пользователей
+    """
+    return _load_blacklist(db, user_id) | _load_favorite_ids(db, user_id)
+
+
+def cache_matches(
+    db: Session,
+    user_id: int,
+    matches: List[Dict],
+    commit: bool = True
+) -> bool:
+    """Кэширует нескольких кандидатов одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Уже закэшированные кандидаты получают новую оценку и фотографии,
+    а last_shown — текущее время.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+        matches (List[Dict]): Кандидаты с ключами id, photos и match_score
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        bool: True если сохранение прошло успешно, иначе False
+    """
+    if not matches:
+        return True
+
+    try:
+        with _savepoint(db, commit):
+            # Повтор кандидата в одной пачке ON CONFLICT DO UPDATE не допускает
+            rows = {
+                match["id"]: {
+                    "user_id": user_id,
+                    "matched_user_id": match["id"],
+                    "photos": match["photos"],
+                    "match_score": match.get("match_score", 0.0)
+                }
+                for match in matches
+            }
+            stmt = pg_insert(models.Match).values(list(rows.values()))
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["user_id", "matched_user_id"],
+                set_={
+                    "match_score": stmt.excluded.match_score,
+                    "photos": stmt.excluded.photos,
+                    "last_shown": datetime.now()
+                }
+            ))
+            _commit(db, commit)
+            return True
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка кэширования кандидатов: {e}")
+        return False
 
 
 def get_favorites(db: Session, user_id: int) -> List[models.Favorite]:
@@ -282,7 +540,20 @@ def get_favorites(db: Session, user_id: int) -> List[models.Favorite]:
     Returns:
         List[models.Favorite]: Список избранных пользователей
     """
-    return db.query(models.Favorite).filter_by(user_id=user_id).all()
+    return list(db.execute(_SELECT_FAVORITES, {"uid": user_id}).scalars())
+
+
+def get_favorite_ids(db: Session, user_id: int) -> List[int]:
+    """Возвращает ID избранных пользователей без загрузки ORM-объектов.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+
+    Returns:
+        List[int]: ID избранных пользователей
+    """
+    return list(db.execute(_SELECT_FAVORITE_IDS, {"uid": user_id}).scalars())
 
 
 def get_blacklist(db: Session, user_id: int) -> List[models.Blacklist]:
@@ -298,13 +569,28 @@ def get_blacklist(db: Session, user_id: int) -> List[models.Blacklist]:
     return db.query(models.Blacklist).filter_by(user_id=user_id).all()
 
 
-def save_user_state(db: Session, user_id: int, state: BotState) -> bool:
+def get_blacklist_ids(db: Session, user_id: int) -> List[int]:
+    """Возвращает ID заблокированных пользователей без загрузки ORM-объектов.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+
+    Returns:
+        List[int]: ID заблокированных пользователей
+    """
+    return list(db.execute(_SELECT_BLACKLIST_IDS, {"uid": user_id}).scalars())
+
+
+@invalidates(_user_cache)
+def save_user_state(db: Session, user_id: int, state: BotState, commit: bool = True) -> bool:
     """Сохраняет состояние пользователя в базе данных.
 
     Args:
         db (Session): Сессия базы данных
         user_id (int): ID пользователя
         state (BotState): Состояние пользователя
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         bool: True если сохранение прошло успешно, иначе False
@@ -312,12 +598,57 @@ def save_user_state(db: Session, user_id: int, state: BotState) -> bool:
     if not isinstance(state, BotState):
         raise ValueError(f"Недопустимое состояние: {state}. Должно быть BotState enum")
     
-    user = get_user(db, user_id)
-    if user:
-        user.state = state
-        db.commit()
-        return True
-    return False
+    try:
+        with _savepoint(db, commit):
+            # Один запрос вместо SELECT + UPDATE
+            updated = db.execute(
+                _UPDATE_USER_STATE, {"uid": user_id, "state": state}
+            ).first()
+            _commit(db, commit)
+            return updated is not None
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка сохранения состояния: {e}")
+        return False
+
+
+def save_user_states(
+    db: Session,
+    states: Dict[int, BotState],
+    commit: bool = True
+) -> Optional[FrozenSet[int]]:
+    """Сохраняет состояния нескольких пользователей одним запросом UPDATE.
+
+    Args:
+        db (Session): Сессия базы данных
+        states (Dict[int, BotState]): Состояния по ID пользователей
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        Optional[FrozenSet[int]]: ID пользователей, чьи строки обновлены, или None
+            при ошибке. Пользователей без строки в users (еще не созданных или
+            созданных в незафиксированной транзакции) в результате нет
+    """
+    if not states:
+        return frozenset()
+
+    try:
+        with _savepoint(db, commit):
+            updated = db.execute(
+                update(models.User).where(
+                    models.User.user_id.in_(states)
+                ).values(
+                    state=case(states, value=models.User.user_id)
+                ).returning(models.User.user_id)
+            ).scalars().all()
+            for user_id in states:
+                invalidate_after_transaction(db, _user_cache, user_id)
+            _commit(db, commit)
+            return frozenset(updated)
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка сохранения состояний: {e}")
+        return None
 
 
 def get_user_state(db: Session, user_id: int) -> Optional[BotState]:
@@ -330,21 +661,17 @@ def get_user_state(db: Session, user_id: int) -> Optional[BotState]:
     Returns:
         Optional[BotState]: Состояние пользователя или None
     """
+    # BotStateType уже возвращает BotState, отдельное преобразование не нужно
     user = get_user(db, user_id)
-    if user and user.state:
-        try:
-            return BotState(user.state)
-        except ValueError:
-            logger.error(f"Недопустимое состояние в БД: {user.state}")
-            return None
-    return None
+    return user.state if user else None
 
 
 def like_photo(
     db: Session,
     user_id: int,
     photo_owner_id: int,
-    photo_id: int
+    photo_id: int,
+    commit: bool = True
 ) -> Optional[models.PhotoLike]:
     """Добавляет лайк фотографии.
 
@@ -353,30 +680,21 @@ def like_photo(
         user_id (int): ID пользователя
         photo_owner_id (int): ID владельца фотографии
         photo_id (int): ID фотографии
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         Optional[models.PhotoLike]: Созданная запись или None при ошибке
     """
     try:
-        existing = db.query(models.PhotoLike).filter_by(
-            user_id=user_id,
-            photo_owner_id=photo_owner_id,
-            photo_id=photo_id
-        ).first()
-        
-        if existing:
-            return existing
-            
-        like = models.PhotoLike(
-            user_id=user_id,
-            photo_owner_id=photo_owner_id,
-            photo_id=photo_id
-        )
-        db.add(like)
-        db.commit()
-        return like
+        with _savepoint(db, commit):
+            return _insert_or_get(
+                db, models.PhotoLike,
+                {"user_id": user_id, "photo_owner_id": photo_owner_id, "photo_id": photo_id},
+                ["user_id", "photo_owner_id", "photo_id"],
+                commit=commit
+            )
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка добавления лайка: {e}")
         return None
 
@@ -385,7 +703,8 @@ def unlike_photo(
     db: Session,
     user_id: int,
     photo_owner_id: int,
-    photo_id: int
+    photo_id: int,
+    commit: bool = True
 ) -> bool:
     """Удаляет лайк фотографии.
 
@@ -394,28 +713,139 @@ def unlike_photo(
         user_id (int): ID пользователя
         photo_owner_id (int): ID владельца фотографии
         photo_id (int): ID фотографии
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         bool: True если удаление прошло успешно, иначе False
     """
     try:
-        like = db.query(models.PhotoLike).filter_by(
-            user_id=user_id,
-            photo_owner_id=photo_owner_id,
-            photo_id=photo_id
-        ).first()
-        
-        if like:
-            db.delete(like)
-            db.commit()
+        with _savepoint(db, commit):
+            deleted = db.query(models.PhotoLike).filter_by(
+                user_id=user_id,
+                photo_owner_id=photo_owner_id,
+                photo_id=photo_id
+            ).delete(synchronize_session=False)
+            _commit(db, commit)
+            return deleted > 0
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка удаления лайка: {e}")
+        return False
+
+
+def bulk_like_photos(
+    db: Session,
+    user_id: int,
+    photos: List[Tuple[int, int]],
+    commit: bool = True
+) -> bool:
+    """Добавляет лайки нескольким фотографиям за одну транзакцию.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+        photos (List[Tuple[int, int]]): Пары (ID владельца, ID фотографии)
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        bool: True если все фотографии лайкнуты, иначе False
+    """
+    if not photos:
+        return False
+
+    try:
+        with _savepoint(db, commit):
+            # Уже поставленные лайки пропускаются уникальным индексом
+            rows = [
+                {
+                    "user_id": user_id,
+                    "photo_owner_id": owner_id,
+                    "photo_id": photo_id
+                }
+                for owner_id, photo_id in dict.fromkeys(photos)
+            ]
+            db.execute(
+                pg_insert(models.PhotoLike).values(rows).on_conflict_do_nothing(
+                    index_elements=["user_id", "photo_owner_id", "photo_id"]
+                )
+            )
+            _commit(db, commit)
             return True
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка добавления лайков: {e}")
         return False
+
+
+def bulk_unlike_photos(
+    db: Session,
+    user_id: int,
+    photos: List[Tuple[int, int]],
+    commit: bool = True
+) -> bool:
+    """Удаляет лайки нескольких фотографий одним запросом DELETE.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+        photos (List[Tuple[int, int]]): Пары (ID владельца, ID фотографии)
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        bool: True если был удален хотя бы один лайк, иначе False
+    """
+    if not photos:
+        return False
+
+    try:
+        with _savepoint(db, commit):
+            deleted = db.query(models.PhotoLike).filter(
+                models.PhotoLike.user_id == user_id,
+                tuple_(
+                    models.PhotoLike.photo_owner_id,
+                    models.PhotoLike.photo_id
+                ).in_(photos)
+            ).delete(synchronize_session=False)
+            _commit(db, commit)
+            return deleted > 0
     except SQLAlchemyError as e:
-        db.rollback()
-        logger.error(f"Ошибка удаления лайка: {e}")
+        _rollback(db, commit)
+        logger.error(f"Ошибка удаления лайков: {e}")
         return False
 
 
+def has_liked_photos(
+    db: Session,
+    user_id: int,
+    photos: List[Tuple[int, int]]
+) -> bool:
+    """Проверяет, лайкнул ли пользователь хотя бы одну из фотографий.
+
+    Выполняет SELECT EXISTS, который обслуживается уникальным индексом
+    без чтения строк таблицы.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+        photos (List[Tuple[int, int]]): Пары (ID владельца, ID фотографии)
+
+    Returns:
+        bool: True если есть хотя бы один лайк, иначе False
+    """
+    if not photos:
+        return False
+
+    return db.scalar(
+        select(exists().where(
+            models.PhotoLike.user_id == user_id,
+            tuple_(
+                models.PhotoLike.photo_owner_id,
+                models.PhotoLike.photo_id
+            ).in_(photos)
+        ))
+    )
+
+
 def get_user_photo_likes(
     db: Session,
     user_id: int
@@ -432,31 +862,34 @@ def get_user_photo_likes(
     return db.query(models.PhotoLike).filter_by(user_id=user_id).all()
 
 
-def update_user_token(db: Session, user_id: int, token: str) -> bool:
+@invalidates(_user_cache)
+def update_user_token(db: Session, user_id: int, token: str, commit: bool = True) -> bool:
     """Обновляет токен пользователя.
 
     Args:
         db (Session): Сессия базы данных
         user_id (int): ID пользователя
         token (str): Новый токен доступа
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         bool: True если обновление прошло успешно, иначе False
     """
     try:
-        user = db.query(models.User).filter(models.User.user_id == user_id).first()
-        if user:
-            user.access_token = token
-            db.commit()
-            return True
-        return False
+        with _savepoint(db, commit):
+            user = db.query(models.User).filter(models.User.user_id == user_id).first()
+            if user:
+                user.access_token = token
+                _commit(db, commit)
+                return True
+            return False
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка обновления токена: {e}")
         return False
 
 
-def save_verifier(db: Session, user_id: int, verifier: str, state: str) -> bool:
+def save_verifier(db: Session, user_id: int, verifier: str, state: str, commit: bool = True) -> bool:
     """Сохраняет code_verifier и state для аутентификации.
 
     Args:
@@ -464,26 +897,32 @@ def save_verifier(db: Session, user_id: int, verifier: str, state: str) -> bool:
         user_id (int): ID пользователя
         verifier (str): Code verifier для OAuth
         state (str): Уникальный state для аутентификации
+        commit (bool): Фиксировать транзакцию (False — только flush)
 
     Returns:
         bool: True если сохранение прошло успешно, иначе False
     """
     try:
-        db.query(models.AuthState).filter(
-            models.AuthState.user_id == user_id
-        ).delete()
-        
-        new_state = models.AuthState(
-            user_id=user_id,
-            code_verifier=verifier,
-            state=state,
-            expires_at=datetime.now() + timedelta(minutes=10)
-        )
-        db.add(new_state)
-        db.commit()
-        return True
+        with _savepoint(db, commit):
+            # У пользователя одна активная попытка входа: новая заменяет старую
+            stmt = pg_insert(models.AuthState).values(
+                user_id=user_id,
+                code_verifier=verifier,
+                state=state,
+                expires_at=datetime.now() + timedelta(minutes=10)
+            )
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "code_verifier": stmt.excluded.code_verifier,
+                    "state": stmt.excluded.state,
+                    "expires_at": stmt.excluded.expires_at
+                }
+            ))
+            _commit(db, commit)
+            return True
     except SQLAlchemyError as e:
-        db.rollback()
+        _rollback(db, commit)
         logger.error(f"Ошибка сохранения verifier: {e}")
         return False
 
@@ -500,18 +939,40 @@ def get_verifier(db: Session, user_id: int, state: str) -> Optional[str]:
         Optional[str]: Code verifier или None, если не найден
     """
     try:
-        record = db.query(models.AuthState).filter(
-            models.AuthState.user_id == user_id,
-            models.AuthState.state == state,
-            models.AuthState.expires_at > datetime.now()
-        ).first()
-        return record.code_verifier if record else None
+        return db.execute(
+            _SELECT_VERIFIER,
+            {"uid": user_id, "state": state, "now": datetime.now()}
+        ).scalar_one_or_none()
     except SQLAlchemyError as e:
         logger.error(f"Ошибка получения verifier: {e}")
         return None
 
 
-def get_search_params(db: Session, user_id: int) -> Optional[models.SearchParams]:
+def purge_expired_auth_states(db: Session, commit: bool = True) -> int:
+    """Удаляет просроченные записи аутентификации.
+
+    Args:
+        db (Session): Сессия базы данных
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    try:
+        with _savepoint(db, commit):
+            deleted = db.query(models.AuthState).filter(
+                models.AuthState.expires_at < datetime.now()
+            ).delete(synchronize_session=False)
+            _commit(db, commit)
+            return deleted
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка очистки auth_states: {e}")
+        return 0
+
+
+@cached(_search_params_cache)
+def get_search_params(db: Session, user_id: int) -> Optional[SimpleNamespace]:
     """Получает параметры поиска для пользователя.
 
     Args:
@@ -519,7 +980,50 @@ def get_search_params(db: Session, user_id: int) -> Optional[models.SearchParams
         user_id (int): ID пользователя
 
     Returns:
-        Optional[models.SearchParams]: Параметры поиска или None
+        Optional[SimpleNamespace]: Снимок параметров поиска (только для чтения) или None
     """
-    return db.query(models.SearchParams).filter(models.SearchParams.user_id == user_id).first()
-    
\ No newline at end of file
+    return _snapshot(db.execute(_SELECT_SEARCH_PARAMS, {"uid": user_id}).scalar_one_or_none())
+
+
+@invalidates(_search_params_cache)
+def get_or_create_search_params(
+    db: Session,
+    user_id: int,
+    defaults_fn: Callable[[], Optional[Dict]],
+    commit: bool = True
+) -> Optional[SimpleNamespace]:
+    """Возвращает параметры поиска, создавая их со значениями по умолчанию.
+
+    Создание выполняется одним запросом INSERT ... ON CONFLICT DO NOTHING RETURNING,
+    поэтому параллельные вызовы не создают дубликатов. Предназначена для вызова
+    после промаха get_search_params: существующая строка читается отдельным SELECT.
+
+    Args:
+        db (Session): Сессия базы данных
+        user_id (int): ID пользователя
+        defaults_fn (Callable[[], Optional[Dict]]): Возвращает значения по умолчанию
+            или None, если создать параметры невозможно
+        commit (bool): Фиксировать транзакцию (False — только flush)
+
+    Returns:
+        Optional[SimpleNamespace]: Снимок параметров поиска или None при ошибке
+    """
+    defaults = defaults_fn()
+    if defaults is None:
+        return None
+
+    try:
+        with _savepoint(db, commit):
+            stmt = pg_insert(models.SearchParams).values(
+                user_id=user_id, **defaults
+            ).on_conflict_do_nothing(
+                index_elements=[models.SearchParams.user_id]
+            ).returning(models.SearchParams)
+            params = db.scalars(stmt).first()
+            _commit(db, commit)
+            # Строку успел создать параллельный запрос
+            return _snapshot(params) if params else get_search_params(db, user_id)
+    except SQLAlchemyError as e:
+        _rollback(db, commit)
+        logger.error(f"Ошибка создания параметров поиска: {e}")
+        return None
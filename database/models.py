@@ -3,13 +3,28 @@
 Содержит все модели SQLAlchemy, используемые в проекте.
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, JSON, Float, DateTime
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, TIMESTAMP, ForeignKey, Float, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 from database import Base
-from sqlalchemy import Enum as SqlEnum 
 from utils.states import BotState
 
 
+class BotStateType(TypeDecorator):
+    """Хранит BotState в колонке SMALLINT как порядковый номер состояния."""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return int(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return BotState(value) if value is not None else None
+
+
 class User(Base):
     """Модель пользователя ВКонтакте.
 
@@ -33,14 +48,26 @@ class User(Base):
     age = Column(Integer)
     gender = Column(String(10))
     city = Column(String(100))
+    # Не откладывается: токен проверяется при каждом сообщении, и отдельный
+    # запрос за ним добавил бы по SELECT на событие. Снимок get_user хранит
+    # его не дольше TTL кэша, а в памяти процесса токен и так держат
+    # _get_vk_api, ведра TokenBucket и проверенные токены бота
     access_token = Column(String(500))
     registration_date = Column(TIMESTAMP, server_default=func.now())
     state = Column(
-        SqlEnum(BotState, name='bot_state'),
+        BotStateType(),
         default=BotState.MAIN_MENU,
+        server_default=str(BotState.MAIN_MENU.value),
         nullable=False
     )
 
+    __table_args__ = (
+        Index(
+            'ix_users_state_active', 'state',
+            postgresql_where=state != BotState.MAIN_MENU
+        ),
+    )
+
 
 class SearchParams(Base):
     """Модель параметров поиска для пользователя.
@@ -94,6 +121,10 @@ class Favorite(Base):
     favorite_user_id = Column(Integer)
     added_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        Index('ix_favorites_user_favorite', 'user_id', 'favorite_user_id', unique=True),
+    )
+
 
 class Blacklist(Base):
     """Модель черного списка пользователей.
@@ -112,6 +143,10 @@ class Blacklist(Base):
     blocked_user_id = Column(Integer)
     blocked_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        Index('ix_blacklist_user_blocked', 'user_id', 'blocked_user_id', unique=True),
+    )
+
 
 class Match(Base):
     """Модель кэширования найденных кандидатов.
@@ -121,7 +156,7 @@ class Match(Base):
         user_id (int): Идентификатор пользователя, для которого найден кандидат (внешний ключ)
         matched_user_id (int): Идентификатор найденного кандидата
         match_score (float): Оценка совпадения (от 0.0 до 1.0)
-        photos (JSON): Список фотографий кандидата в формате JSON
+        photos (JSONB): Список фотографий кандидата
         last_shown (datetime): Дата и время последнего показа кандидата
     """
 
@@ -131,9 +166,14 @@ class Match(Base):
     user_id = Column(Integer, ForeignKey('users.user_id'))
     matched_user_id = Column(Integer)
     match_score = Column(Float)
-    photos = Column(JSON)
+    # Загружается только при обращении: спискам совпадений фото не нужны
+    photos = deferred(Column(JSONB))
     last_shown = Column(TIMESTAMP)
 
+    __table_args__ = (
+        Index('ix_matches_user_matched', 'user_id', 'matched_user_id', unique=True),
+    )
+
 
 class AuthState(Base):
     """Модель для хранения состояния аутентификации.
@@ -154,6 +194,10 @@ class AuthState(Base):
     state = Column(String(64), nullable=False, unique=True)
     expires_at = Column(DateTime, nullable=False)
 
+    __table_args__ = (
+        Index('ix_auth_states_user_id', 'user_id', unique=True),
+    )
+
 
 class PhotoLike(Base):
     """Модель лайков фотографий.
@@ -173,4 +217,8 @@ class PhotoLike(Base):
     photo_owner_id = Column(Integer)
     photo_id = Column(Integer)
     liked_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_photo_likes_user_photo', 'user_id', 'photo_owner_id', 'photo_id', unique=True),
+    )
     
\ No newline at end of file
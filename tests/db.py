@@ -0,0 +1,41 @@
+"""Общая для тестов база SQLite в памяти."""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+
+
+@compiles(JSONB, "sqlite")
+def _compile_jsonb_sqlite(type_, compiler, **kw):
+    """JSONB есть только в PostgreSQL: в SQLite колонка создается как JSON.
+
+    Меняется только DDL для диалекта SQLite, а модель остается прежней;
+    значения сериализует JSON-тип SQLite, к которому адаптируется JSONB.
+    """
+    return "JSON"
+
+
+def make_session() -> scoped_session:
+    """Создает scoped_session поверх чистой SQLite-базы в памяти."""
+    engine = create_engine(
+        "sqlite://",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False}
+    )
+
+    # pysqlite сам управляет транзакциями и ломает SAVEPOINT; по рецепту
+    # SQLAlchemy транзакцию открывает движок
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(engine)
+    return scoped_session(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False))
@@ -0,0 +1,250 @@
+"""Тесты обработки событий бота на SQLite в памяти."""
+
+import unittest
+from unittest import mock
+
+from sqlalchemy.orm import scoped_session
+
+from database import models
+from database.crud import create_user
+import bot as bot_module
+from tests.db import make_session
+
+
+def make_bot(session: scoped_session) -> bot_module.VKBot:
+    """Создает бота без подключения к VK и фоновых потоков."""
+    bot = bot_module.VKBot.__new__(bot_module.VKBot)
+    bot.db_session = session
+    bot.user_cache = {}
+    bot._user_events = {}
+    bot._user_events_guard = bot_module.threading.Lock()
+    bot._event_local = bot_module.threading.local()
+    bot._enqueue_send = lambda params: None
+    bot._send_direct = lambda params: None
+    return bot
+
+
+class RunHandlerTest(unittest.TestCase):
+    def test_event_writes_are_committed(self):
+        session = make_session()
+        bot = make_bot(session)
+
+        def handle_auth_flow(user_id, text, folded):
+            create_user(session(), {
+                "user_id": user_id,
+                "first_name": "Иван",
+                "last_name": "Иванов",
+                "gender": "male"
+            }, commit=False)
+            return "ok"
+
+        bot.handle_auth_flow = handle_auth_flow
+        bot._run_handler(1, bot._handle_event, 1, "авторизоваться")
+
+        check = session.session_factory()
+        try:
+            self.assertIsNotNone(check.get(models.User, 1))
+        finally:
+            check.close()
+
+    def test_messages_are_sent_only_after_commit(self):
+        bot = make_bot(make_session())
+        sent = []
+        bot._enqueue_send = sent.append
+
+        def handler():
+            bot._queue_send(user_id=1, message="ok", random_id=0)
+            self.assertEqual(sent, [])
+
+        bot._run_handler(1, handler)
+
+        self.assertEqual([p["message"] for p in sent], ["ok"])
+
+    def test_rolled_back_messages_are_replaced_by_error(self):
+        bot = make_bot(make_session())
+        sent = []
+        bot._enqueue_send = sent.append
+
+        def handler():
+            bot._queue_send(user_id=1, message="✅ Добавлено в избранное", random_id=0)
+            raise RuntimeError("commit failed")
+
+        bot._run_handler(1, handler)
+
+        self.assertEqual(len(sent), 1)
+        self.assertNotIn("Добавлено", sent[0]["message"])
+
+    def test_rolled_back_state_is_not_buffered(self):
+        bot = make_bot(make_session())
+        buffered = []
+        bot._buffer_states = buffered.append
+
+        def handler():
+            bot._set_state(1, bot_module.BotState.MAIN_MENU)
+            raise RuntimeError("commit failed")
+
+        bot._run_handler(1, handler)
+
+        self.assertFalse(any(buffered))
+        self.assertNotIn('state', bot.user_cache[1])
+
+
+class UserEventsTest(unittest.TestCase):
+    def test_events_run_in_submission_order(self):
+        bot = make_bot(make_session())
+        bot._pool = bot_module.ThreadPoolExecutor(max_workers=2)
+        order = []
+        started = bot_module.threading.Event()
+        release = bot_module.threading.Event()
+
+        def first():
+            started.set()
+            release.wait(5)
+            order.append("A")
+
+        bot._submit_event(1, first)
+        started.wait(5)
+        bot._submit_event(1, order.append, "B")
+        release.set()
+        bot._pool.shutdown(wait=True)
+
+        self.assertEqual(order, ["A", "B"])
+
+    def test_idle_user_queue_is_dropped(self):
+        bot = make_bot(make_session())
+        bot._pool = bot_module.ThreadPoolExecutor(max_workers=1)
+        bot._submit_event(1, lambda: None)
+        bot._pool.shutdown(wait=True)
+        self.assertEqual(bot._user_events, {})
+
+
+class RetryWorkerTest(unittest.TestCase):
+    def test_stopped_worker_exits_without_submitting(self):
+        bot = make_bot(make_session())
+        bot._retry_queue = [(0, 1)]
+        bot._retry_cond = bot_module.threading.Condition()
+        bot._retry_stopped = True
+        bot._pool = mock.Mock()
+
+        bot._retry_worker()
+
+        bot._pool.submit.assert_not_called()
+
+
+class SendOrderTest(unittest.TestCase):
+    def test_direct_send_waits_for_batch_in_flight(self):
+        bot = make_bot(make_session())
+        del bot._send_direct
+        bot._send_queue = [{"message": "queued"}]
+        bot._send_lock = bot_module.threading.Lock()
+        bot._send_event = bot_module.threading.Event()
+        bot._sending = bot_module.threading.RLock()
+        bot.vk_session = None
+        sent = []
+        started = bot_module.threading.Event()
+        release = bot_module.threading.Event()
+
+        class FakePool:
+            def __init__(self, session):
+                self.params = []
+
+            def __enter__(self):
+                return self
+
+            def method(self, name, params):
+                self.params.append(params)
+                return mock.Mock(ok=True)
+
+            def __exit__(self, *exc):
+                started.set()
+                release.wait(5)
+                sent.extend(p["message"] for p in self.params)
+
+        bot.vk = mock.Mock()
+        bot.vk.messages.send.side_effect = lambda **params: sent.append(params["message"])
+
+        with mock.patch.object(bot_module, "VkRequestsPool", FakePool):
+            flusher = bot_module.threading.Thread(target=bot._flush_sends)
+            flusher.start()
+            started.wait(5)
+            direct = bot_module.threading.Thread(
+                target=bot._send_now, kwargs={"message": "direct"}
+            )
+            direct.start()
+            direct.join(0.1)
+            release.set()
+            flusher.join(5)
+            direct.join(5)
+
+        self.assertEqual(sent, ["queued", "direct"])
+
+
+class StateFlushTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_bot(make_session())
+        self.bot._state_writebuf = {1: bot_module.BotState.FAVORITES}
+        self.bot._writebuf_lock = bot_module.threading.Lock()
+        self.bot._writebuf_event = bot_module.threading.Event()
+        self.bot._state_missing_rows = {}
+
+    def test_failed_write_is_requeued_and_wakes_flusher(self):
+        with mock.patch.object(bot_module, "save_user_states", return_value=None):
+            self.assertFalse(self.bot._flush_states())
+
+        self.assertEqual(self.bot._state_writebuf, {1: bot_module.BotState.FAVORITES})
+        self.assertTrue(self.bot._writebuf_event.is_set())
+
+    def test_state_without_user_row_is_dropped_after_retries(self):
+        with mock.patch.object(bot_module, "save_user_states", return_value=frozenset()):
+            for _ in range(bot_module.STATE_MISSING_ROW_RETRIES):
+                self.assertTrue(self.bot._flush_states())
+                self.assertIn(1, self.bot._state_writebuf)
+            self.bot._flush_states()
+
+        self.assertEqual(self.bot._state_writebuf, {})
+        self.assertEqual(self.bot._state_missing_rows, {})
+
+
+class DispatchTablesTest(unittest.TestCase):
+    def test_every_action_resolves_to_method(self):
+        names = [
+            *bot_module.VKBot._MAIN_MENU_ACTIONS.values(),
+            *(method for method, _ in bot_module.VKBot._CANDIDATE_ACTIONS.values()),
+            *bot_module.VKBot._FAVORITES_ACTIONS.values(),
+            *bot_module.VKBot._SETTINGS_ACTIONS.values(),
+            *(method for method, _, _ in bot_module.VKBot._STATE_HANDLERS.values()),
+        ]
+        for name in names:
+            with self.subTest(name=name):
+                self.assertTrue(callable(getattr(bot_module.VKBot, name, None)))
+
+    def test_gender_choice_reaches_handler(self):
+        bot = make_bot(make_session())
+        chosen = []
+        bot._process_gender_selection = lambda db, user_id, text: chosen.append(text)
+
+        bot._handle_settings_actions(1, '👩 Женский')
+
+        self.assertEqual(chosen, ['👩 Женский'])
+
+
+class TokenValidationTest(unittest.TestCase):
+    def test_check_is_cached_per_user_and_token(self):
+        bot = make_bot(make_session())
+        bot._valid_tokens = bot_module.TTLCache(maxsize=10, ttl=60)
+        checked = []
+
+        def validate_token(token):
+            checked.append(token)
+            return True
+
+        with mock.patch.object(bot_module, "validate_token", validate_token):
+            self.assertTrue(bot._is_token_valid(1, "a"))
+            self.assertTrue(bot._is_token_valid(1, "a"))
+            self.assertTrue(bot._is_token_valid(1, "b"))
+
+        self.assertEqual(checked, ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
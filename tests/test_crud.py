@@ -0,0 +1,114 @@
+"""Тесты кэширования CRUD-функций."""
+
+import unittest
+from types import SimpleNamespace
+
+from database import models
+from database.crud import _user_cache, create_user, get_user, update_user_token
+from tests.db import make_session
+
+
+class UserCacheTest(unittest.TestCase):
+    def setUp(self):
+        _user_cache.clear()
+        self.session = make_session()
+        create_user(self.session(), {
+            "user_id": 1,
+            "first_name": "Иван",
+            "last_name": "Иванов",
+            "gender": "male",
+            "access_token": "old"
+        })
+        self.session.remove()
+
+    def test_cached_user_survives_rollback_of_loading_session(self):
+        loader = self.session.session_factory()
+        get_user(loader, 1)
+        loader.rollback()
+        loader.close()
+
+        reader = self.session.session_factory()
+        try:
+            self.assertEqual(get_user(reader, 1).access_token, "old")
+        finally:
+            reader.close()
+
+    def test_deferred_commit_invalidates_concurrently_cached_row(self):
+        writer = self.session.session_factory()
+        try:
+            update_user_token(writer, 1, "new", commit=False)
+            # Параллельный читатель успел положить в кэш строку до фиксации
+            _user_cache.set(1, SimpleNamespace(access_token="old"))
+            writer.commit()
+            self.assertEqual(get_user(writer, 1).access_token, "new")
+        finally:
+            writer.close()
+
+    def test_rollback_restores_committed_row(self):
+        writer = self.session.session_factory()
+        try:
+            update_user_token(writer, 1, "new", commit=False)
+            writer.rollback()
+            self.assertEqual(get_user(writer, 1).access_token, "old")
+        finally:
+            writer.close()
+
+    def test_rollback_drops_row_read_after_uncommitted_write(self):
+        writer = self.session.session_factory()
+        try:
+            update_user_token(writer, 1, "new", commit=False)
+            # Чтение в той же транзакции кэширует незафиксированную строку
+            self.assertEqual(get_user(writer, 1).access_token, "new")
+            writer.rollback()
+        finally:
+            writer.close()
+
+        reader = self.session.session_factory()
+        try:
+            self.assertEqual(get_user(reader, 1).access_token, "old")
+        finally:
+            reader.close()
+
+    def test_rollback_drops_user_read_after_uncommitted_create(self):
+        writer = self.session.session_factory()
+        try:
+            create_user(writer, {
+                "user_id": 2,
+                "first_name": "Петр",
+                "last_name": "Петров",
+                "gender": "male"
+            }, commit=False)
+            self.assertIsNotNone(get_user(writer, 2))
+            writer.rollback()
+        finally:
+            writer.close()
+
+        reader = self.session.session_factory()
+        try:
+            self.assertIsNone(get_user(reader, 2))
+        finally:
+            reader.close()
+
+
+class SavepointTest(unittest.TestCase):
+    def test_failed_deferred_write_keeps_earlier_changes(self):
+        session = make_session()
+        db = session()
+        try:
+            user = {"user_id": 1, "first_name": "Иван", "last_name": "Иванов", "gender": "male"}
+            self.assertIsNotNone(create_user(db, user, commit=False))
+            # Повторная вставка нарушает первичный ключ
+            self.assertIsNone(create_user(db, user, commit=False))
+            db.commit()
+        finally:
+            session.remove()
+
+        check = session.session_factory()
+        try:
+            self.assertIsNotNone(check.get(models.User, 1))
+        finally:
+            check.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+"""Тесты ревизий Alembic."""
+
+import importlib.util
+import unittest
+from pathlib import Path
+
+from utils.states import BotState
+
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+
+def load_revision(filename: str):
+    """Загружает модуль ревизии по имени файла (каталог versions не пакет)."""
+    spec = importlib.util.spec_from_file_location(filename[:-3], VERSIONS / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StateOrdinalsTest(unittest.TestCase):
+    def test_snapshot_matches_bot_state(self):
+        revision = load_revision("b9e4c7a1d2f3_store_user_state_as_smallint.py")
+        self.assertEqual(revision.STATES, {s.name: s.value for s in BotState})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,221 @@
+"""Модуль простых in-process кэшей.
+
+Содержит LRU-кэш с ограничением времени жизни записей и декораторы
+для кэширования чтений из БД с инвалидацией при записи (повторной —
+после завершения транзакции).
+"""
+
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Hashable
+import threading
+import time
+
+# Маркер отсутствия значения в кэше (None — допустимое значение)
+MISS = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш с ограниченным размером и временем жизни записей.
+
+    Атрибуты:
+        maxsize (int): Максимальное количество записей
+        ttl (float): Время жизни записи в секундах
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        """
+        Инициализация кэша.
+
+        Аргументы:
+            maxsize (int): Максимальное количество записей
+            ttl (float): Время жизни записи в секундах
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # {key: (expires_at, value)}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISS) -> Any:
+        """
+        Возвращает значение по ключу.
+
+        Аргументы:
+            key (Hashable): Ключ записи
+            default (Any): Значение при промахе (по умолчанию MISS)
+
+        Возвращает:
+            Any: Сохраненное значение или default, если записи нет или она устарела
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохраняет значение, вытесняя самую старую запись при переполнении.
+
+        Аргументы:
+            key (Hashable): Ключ записи
+            value (Any): Сохраняемое значение
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Удаляет запись из кэша.
+
+        Аргументы:
+            key (Hashable): Ключ записи
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Очищает кэш."""
+        with self._lock:
+            self._data.clear()
+
+
+class LRUDict(OrderedDict):
+    """
+    Словарь с ограниченной емкостью, вытесняющий давно не использованные ключи.
+
+    Атрибуты:
+        maxsize (int): Максимальное количество записей
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        """
+        Инициализация словаря.
+
+        Аргументы:
+            maxsize (int): Максимальное количество записей
+        """
+        super().__init__()
+        self.maxsize = maxsize
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            if len(self) > self.maxsize:
+                self.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self:
+                return self[key]
+            return default
+
+    def setdefault(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self:
+                return self[key]
+            self[key] = default
+            return default
+
+
+def _cache_key(args: tuple) -> Hashable:
+    """Строит ключ кэша из аргументов функции (без сессии БД)."""
+    return args[0] if len(args) == 1 else args
+
+
+def cached(cache: TTLCache) -> Callable:
+    """
+    Кэширует результат CRUD-функции вида f(db, *args).
+
+    Ключом служат аргументы после сессии БД. Пустые результаты (None)
+    не кэшируются, чтобы не прятать только что созданные записи.
+
+    Аргументы:
+        cache (TTLCache): Кэш для хранения результатов
+
+    Возвращает:
+        Callable: Декоратор
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(db, *args):
+            key = _cache_key(args)
+            value = cache.get(key)
+            if value is MISS:
+                value = func(db, *args)
+                if value is not None:
+                    cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
+
+
+# Ключ в Session.info со списком записей, сбрасываемых после завершения транзакции
+PENDING_INVALIDATIONS = 'cache_invalidations'
+
+
+def invalidate_after_transaction(db, cache: TTLCache, key: Hashable) -> None:
+    """
+    Сбрасывает запись сразу и еще раз после фиксации или отката транзакции сессии.
+
+    Пока изменение не зафиксировано, параллельный читатель может снова
+    положить в кэш старую строку, а чтение в той же транзакции — новую,
+    еще не зафиксированную; повторный сброс убирает обе. Сессия должна
+    вызывать run_pending_invalidations в событиях after_commit и after_rollback.
+
+    Аргументы:
+        db: Сессия базы данных
+        cache (TTLCache): Кэш с записью
+        key (Hashable): Ключ записи
+    """
+    db.info.setdefault(PENDING_INVALIDATIONS, []).append((cache, key))
+    cache.invalidate(key)
+
+
+def run_pending_invalidations(db) -> None:
+    """Сбрасывает записи, отложенные до завершения транзакции сессии."""
+    for cache, key in db.info.pop(PENDING_INVALIDATIONS, ()):
+        cache.invalidate(key)
+
+
+def invalidates(*caches: TTLCache) -> Callable:
+    """
+    Сбрасывает записи пользователя в кэшах после CRUD-функции вида f(db, user_id, ...).
+
+    Запись сбрасывается сразу и повторно после завершения транзакции
+    (см. invalidate_after_transaction), в том числе если фиксирует вызывающий код.
+
+    Аргументы:
+        *caches (TTLCache): Кэши, в которых хранятся данные пользователя
+
+    Возвращает:
+        Callable: Декоратор
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(db, user_id, *args, **kwargs):
+            # Регистрируем до вызова: функция может зафиксировать транзакцию сама
+            for cache in caches:
+                db.info.setdefault(PENDING_INVALIDATIONS, []).append((cache, user_id))
+            result = func(db, user_id, *args, **kwargs)
+            for cache in caches:
+                cache.invalidate(user_id)
+            return result
+        return wrapper
+    return decorator
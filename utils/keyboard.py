@@ -1,8 +1,10 @@
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
 from typing import Optional
+from functools import lru_cache
 import json
 
 
+@lru_cache(maxsize=None)
 def get_main_keyboard() -> Optional[dict]:
     """
     Создает клавиатуру главного меню.
@@ -28,6 +30,7 @@ def get_main_keyboard() -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_candidate_keyboard(has_liked: bool = False) -> Optional[dict]:
     """
     Создает клавиатуру для взаимодействия с профилем кандидата.
@@ -58,6 +61,7 @@ def get_candidate_keyboard(has_liked: bool = False) -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_favorites_keyboard() -> Optional[dict]:
     """
     Создает клавиатуру для работы с избранными профилями.
@@ -75,6 +79,7 @@ def get_favorites_keyboard() -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_search_settings_keyboard() -> Optional[dict]:
     """
     Создает клавиатуру для настройки параметров поиска.
@@ -105,6 +110,7 @@ def get_search_settings_keyboard() -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_priority_settings_keyboard() -> Optional[dict]:
     """
     Создает клавиатуру для настройки приоритетов при поиске.
@@ -125,6 +131,7 @@ def get_priority_settings_keyboard() -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_confirm_keyboard() -> Optional[dict]:
     """
     Создает клавиатуру для подтверждения действий.
@@ -140,6 +147,7 @@ def get_confirm_keyboard() -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_gender_keyboard() -> Optional[dict]:
     """
     Создает клавиатуру для выбора пола при поиске.
@@ -157,6 +165,7 @@ def get_gender_keyboard() -> Optional[dict]:
     return kb.get_keyboard()
 
 
+@lru_cache(maxsize=None)
 def get_empty_keyboard() -> Optional[dict]:
     """
     Создает пустую клавиатуру (используется для скрытия предыдущей).
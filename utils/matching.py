@@ -1,22 +1,159 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, FrozenSet, Optional, Tuple
 from sqlalchemy.orm import Session
+from vk_api import exceptions
 import logging
 from database import models
 from database.crud import (
     get_user,
-    get_favorites,
-    is_in_blacklist,
-    cache_match,
+    get_excluded_ids,
+    cache_matches,
     get_user_state
 )
-from vkapi.methods import VKUserData, VKSearch, VKPhotos
-import json
+from vkapi.methods import EXECUTE_BATCH_SIZE, VKUserData, VKSearch, VKPhotos
+from utils.cache import MISS, LRUDict, TTLCache
+from config import Config
+import orjson
 from difflib import SequenceMatcher
-from datetime import datetime, timedelta
+from functools import cached_property
+from collections import deque
+from array import array
+import heapq
+import operator
+import re
 import time
 
 logger = logging.getLogger(__name__)
 
+# Группы и друзья кандидатов: одни и те же анкеты попадают в повторные поиски.
+# ID хранятся плоскими массивами int64 — у кандидата могут быть тысячи друзей,
+# и frozenset из объектов int занимал бы в кэше в несколько раз больше памяти
+_candidate_groups_cache = TTLCache(maxsize=4096, ttl=300)
+_candidate_friends_cache = TTLCache(maxsize=4096, ttl=300)
+
+# Очереди кандидатов к показу: {user_id: deque[Dict]}. Пустая очередь
+# означает, что закэшированные кандидаты просмотрены и нужен новый поиск
+_candidate_queues = LRUDict(maxsize=10000)
+
+# Сколько закэшированных кандидатов загружается из БД за один запрос
+CANDIDATE_BATCH_SIZE = 50
+
+# Сколько лучших кандидатов сохраняется по итогам одного поиска: остальные
+# отбрасываются, и для них не запрашиваются группы, друзья и фото
+TOP_CANDIDATES = Config.MATCH_TOP_CANDIDATES
+
+# Порог схожести, начиная с которого элементы интересов считаются совпавшими
+SIMILARITY_THRESHOLD = 0.7
+
+
+# Критерии оценки кандидата (порядок оценок и весов совпадает).
+# Первые CHEAP_COMPONENTS считаются локально, остальные требуют запросов к API
+SCORE_COMPONENTS = ('age', 'city', 'interests', 'groups', 'friends')
+CHEAP_COMPONENTS = 3
+
+# Все, кроме букв и цифр, при сравнении интересов игнорируется
+_NON_WORD_RE = re.compile(r'\W+')
+
+# Категории интересов, которые users.search возвращает для кандидата
+INTEREST_CATEGORIES = ('interests', 'music', 'books')
+
+
+def _id_array(ids) -> array:
+    """Упаковывает ID в компактный массив int64 для хранения в кэше."""
+    return array('q', ids or ())
+
+
+def _common_count(ids: FrozenSet[int], others: array) -> int:
+    """
+    Считает, сколько ID из массива входит в множество.
+    
+    Проверка вхождения выполняется на уровне C через map, без
+    построения промежуточного множества пересечения.
+    
+    Аргументы:
+        ids (FrozenSet[int]): ID ищущего пользователя
+        others (array): ID кандидата
+        
+    Возвращает:
+        int: Количество общих ID
+    """
+    return sum(map(ids.__contains__, others))
+
+
+def _normalize_interests(interests: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Приводит элементы интересов к нижнему регистру и убирает пустые.
+    
+    Аргументы:
+        interests (Dict[str, List[str]]): Интересы по категориям
+        
+    Возвращает:
+        Dict[str, List[str]]: Нормализованные интересы по категориям
+    """
+    return {
+        category: [item.strip().lower() for item in items if item.strip()]
+        for category, items in interests.items()
+    }
+
+
+def _fuzzy_similarity_sum(items1: List[str], items2: List[str], threshold: float = SIMILARITY_THRESHOLD) -> float:
+    """
+    Суммирует схожесть всех пар элементов, превышающую порог.
+    
+    Данные о втором элементе пары считаются один раз на строку, а пары,
+    у которых верхняя оценка real_quick_ratio/quick_ratio не выше порога,
+    отбрасываются без полного расчета ratio.
+    
+    Аргументы:
+        items1 (List[str]): Элементы первого пользователя
+        items2 (List[str]): Элементы второго пользователя
+        threshold (float): Порог схожести
+        
+    Возвращает:
+        float: Сумма схожестей пар выше порога
+    """
+    total = 0.0
+    matcher = SequenceMatcher()
+    for item2 in items2:
+        matcher.set_seq2(item2)
+        for item1 in items1:
+            if item1 == item2:
+                total += 1.0
+                continue
+            matcher.set_seq1(item1)
+            if matcher.real_quick_ratio() <= threshold or matcher.quick_ratio() <= threshold:
+                continue
+            similarity = matcher.ratio()
+            if similarity > threshold:
+                total += similarity
+    return total
+
+
+def _category_similarity(items1: List[str], items2: List[str]) -> float:
+    """
+    Оценивает схожесть двух списков интересов одной категории.
+    
+    Элементы сводятся к каноническим токенам, и считается коэффициент
+    Жаккара по множествам. Нечеткое сравнение выполняется, только если
+    точных совпадений нет.
+    
+    Аргументы:
+        items1 (List[str]): Нормализованные интересы первого пользователя
+        items2 (List[str]): Нормализованные интересы второго пользователя
+        
+    Возвращает:
+        float: Оценка схожести (от 0 до 1)
+    """
+    tokens1 = {_NON_WORD_RE.sub('', item) for item in items1} - {''}
+    tokens2 = {_NON_WORD_RE.sub('', item) for item in items2} - {''}
+    if not tokens1 or not tokens2:
+        return 0.0
+    
+    union = len(tokens1 | tokens2)
+    common = len(tokens1 & tokens2)
+    if common:
+        return common / union
+    return min(1.0, _fuzzy_similarity_sum(list(tokens1), list(tokens2)) / union)
+
 
 class CandidateMatcher:
     """
@@ -83,17 +220,14 @@ class CandidateMatcher:
         Основной метод для поиска кандидатов по заданным параметрам.
         
         Возвращает:
-            List[Dict]: Список найденных кандидатов с оценкой совпадения, 
-                       отсортированный по убыванию оценки.
+            List[Dict]: Не больше TOP_CANDIDATES лучших кандидатов с оценкой
+                       совпадения, отсортированных по убыванию оценки.
                        Возвращает пустой список, если кандидаты не найдены.
         """
         if not self.searcher or not self.search_params:
             logger.error(f"User {self.user_id} or search params not found")
             return []
         
-        # Добавляем задержку перед поиском
-        time.sleep(0.34)  # ~3 запроса в секунду
-        
         params = {
             "min_age": self.search_params.min_age,
             "max_age": self.search_params.max_age,
@@ -111,158 +245,248 @@ class CandidateMatcher:
             else:
                 raise e
         
-        # Получаем сырые результаты поиска
-        raw_candidates = self.vk_search.search(params)
         if not raw_candidates:
             logger.info(f"No candidates found for user {self.user_id}")
             return []
             
-        # Фильтруем и оцениваем кандидатов
-        scored_candidates = []
-        for candidate in raw_candidates:
-            if self._should_skip_candidate(candidate['id']):
-                continue
-                
-            score = self._calculate_match_score(candidate)
-            if score > 0:  # Минимальный порог
-                scored_candidates.append({
-                    **candidate,
-                    'match_score': score,
-                    'photos': self._get_candidate_photos(candidate['id'])
-                })
-        
-        # Сортируем по убыванию оценки
-        scored_candidates.sort(key=lambda x: x['match_score'], reverse=True)
+        # Фильтруем кандидатов: черный список и избранное загружаются один раз
+        excluded = get_excluded_ids(self.db, self.user_id)
+        candidates = [c for c in raw_candidates if not self._should_skip_candidate(c['id'], excluded)]
+        
+        # Оцениваем кандидатов: взвешенная сумма — скалярное произведение
+        # оценок критериев на веса. Сначала считаются дешевые критерии
+        cheap_weights = self._weight_vector[:CHEAP_COMPONENTS]
+        social_weights = self._weight_vector[CHEAP_COMPONENTS:]
+        social_bound = sum(social_weights)  # Максимум, который добавят группы и друзья
+        ranked = sorted(
+            ((sum(map(operator.mul, self._cheap_scores(c), cheap_weights)), c) for c in candidates),
+            key=operator.itemgetter(0),
+            reverse=True
+        )
+        
+        # Группы и друзья запрашиваются пачками через execute, начиная с лучших
+        # по дешевой оценке. Как только верхняя граница оценки не проходит
+        # в топ, остальные кандидаты (с еще меньшей границей) не запрашиваются
+        # В куче хранятся неокругленные оценки, чтобы сравнивать их с такой же
+        # неокругленной границей; до сотых оценка округляется только при выводе
+        top = []  # min-куча (оценка, -порядковый номер, кандидат)
+        for start in range(0, len(ranked), EXECUTE_BATCH_SIZE):
+            batch = ranked[start:start + EXECUTE_BATCH_SIZE]
+            if len(top) == TOP_CANDIDATES and batch[0][0] + social_bound <= top[0][0]:
+                break
+            self._prefetch_social([c['id'] for _, c in batch])
+            for position, (cheap_score, candidate) in enumerate(batch, start):
+                if len(top) == TOP_CANDIDATES and cheap_score + social_bound <= top[0][0]:
+                    break
+                social_score = sum(map(operator.mul, self._social_scores(candidate), social_weights))
+                score = cheap_score + social_score
+                if round(score, 2) <= 0:  # Минимальный порог
+                    continue
+                # Порядковый номер со знаком минус: при равных оценках вытесняется
+                # более поздний кандидат, как и при отсечении по верхней границе
+                item = (score, -position, candidate)
+                if len(top) < TOP_CANDIDATES:
+                    heapq.heappush(top, item)
+                else:
+                    heapq.heappushpop(top, item)
+        
+        # Сортируем по убыванию оценки (при равенстве — в порядке дешевой оценки)
+        scored_candidates = [
+            {**c, 'match_score': round(score, 2)}
+            for score, _, c in sorted(top, key=lambda t: (-t[0], -t[1]))
+        ]
+        
+        # Фото прошедших порог кандидатов запрашиваются пачками через execute
+        photos = self.vk_photos.batch_get_photos([c['id'] for c in scored_candidates])
+        for candidate in scored_candidates:
+            candidate['photos'] = self._get_candidate_photos(candidate['id'], photos.get(candidate['id']))
         
         # Кэшируем результаты
         self._cache_candidates(scored_candidates)
         
         return scored_candidates
 
-    def _should_skip_candidate(self, candidate_id: int) -> bool:
+    def _should_skip_candidate(self, candidate_id: int, excluded: FrozenSet[int]) -> bool:
         """
         Проверяет, нужно ли пропускать кандидата при поиске.
         
         Аргументы:
             candidate_id (int): ID проверяемого кандидата
+            excluded (FrozenSet[int]): ID из черного списка и избранного
             
         Возвращает:
             bool: True если кандидата нужно пропустить, False если нет
         """
-        # Пропускаем себя
-        if candidate_id == self.user_id:
-            return True
-            
-        # Проверяем черный список
-        if is_in_blacklist(self.db, self.user_id, candidate_id):
-            return True
-            
-        # Проверяем, есть ли уже в избранном
-        favorites = [f.favorite_user_id for f in get_favorites(self.db, self.user_id)]
-        if candidate_id in favorites:
-            return True
-            
-        return False
+        # Пропускаем себя, заблокированных и уже добавленных в избранное
+        return candidate_id == self.user_id or candidate_id in excluded
 
-    def _calculate_match_score(self, candidate: Dict) -> float:
+    @cached_property
+    def _weight_vector(self) -> Tuple[float, ...]:
+        """Веса критериев в порядке SCORE_COMPONENTS (вычисляются один раз на объект)."""
+        weights = self._get_weights()
+        return tuple(weights[component] for component in SCORE_COMPONENTS)
+
+    def _cheap_scores(self, candidate: Dict) -> Tuple[float, ...]:
         """
-        Вычисляет оценку совпадения кандидата с параметрами поиска.
+        Вычисляет оценки по критериям, не требующим запросов к API.
         
         Аргументы:
             candidate (Dict): Данные кандидата
             
         Возвращает:
-            float: Оценка совпадения (от 0 до максимально возможного значения)
+            Tuple[float, ...]: Оценки возраста, города и интересов от 0 до 1
         """
-        weights = self._get_weights()
-        total_score = 0.0
+        age_score = city_score = interest_score = 0.0
         
         # Оценка по возрасту
         if self.searcher.age and candidate.get('age'):
             age_diff = abs(self.searcher.age - candidate['age'])
             age_score = max(0, 1 - age_diff / 10)  # Нормализация к 0-1
-            total_score += age_score * weights['age']
         
         # Оценка по городу
         if self.searcher.city and candidate.get('city'):
             if self.searcher.city.lower() == candidate['city'].lower():
-                total_score += 1 * weights['city']
+                city_score = 1.0
         
         # Оценка по интересам
-        if self.search_params.interests:
-            searcher_interests = json.loads(self.search_params.interests)
-            candidate_interests = {
-                'interests': candidate.get('interests', '').split(','),
-                'music': candidate.get('music', '').split(','),
-                'books': candidate.get('books', '').split(',')
-            }
-            interest_score = self._compare_interests(searcher_interests, candidate_interests)
-            total_score += interest_score * weights['interests']
+        if self._searcher_interests:
+            candidate_interests = _normalize_interests({
+                category: (candidate.get(category) or '').split(',')
+                for category in INTEREST_CATEGORIES
+            })
+            interest_score = self._compare_interests(self._searcher_interests, candidate_interests)
+        
+        return age_score, city_score, interest_score
+
+    def _social_scores(self, candidate: Dict) -> Tuple[float, ...]:
+        """
+        Вычисляет оценки по общим группам и друзьям.
+        
+        Аргументы:
+            candidate (Dict): Данные кандидата
+            
+        Возвращает:
+            Tuple[float, ...]: Оценки групп и друзей от 0 до 1
+        """
+        group_score = friends_score = 0.0
         
         # Оценка по группам (если есть доступ)
         try:
-            searcher_groups = {g['id'] for g in self.vk_user.get_groups(self.user_id)}
-            candidate_groups = {g['id'] for g in self.vk_user.get_groups(candidate['id'])}
-            common_groups = searcher_groups & candidate_groups
-            group_score = min(1, len(common_groups) / 10)  # Нормализация
-            total_score += group_score * weights['groups']
+            common_groups = _common_count(self._searcher_groups, self._candidate_groups(candidate['id']))
+            group_score = min(1, common_groups / 10)  # Нормализация
         except Exception as e:
             logger.warning(f"Couldn't compare groups: {e}")
         
         # Оценка по друзьям (если есть доступ)
         try:
-            searcher_friends = set(self.vk_user.get_friends(self.user_id))
-            candidate_friends = set(self.vk_user.get_friends(candidate['id']))
-            common_friends = searcher_friends & candidate_friends
-            friends_score = min(1, len(common_friends) / 5)  # Нормализация
-            total_score += friends_score * weights['friends']
+            common_friends = _common_count(self._searcher_friends, self._candidate_friends(candidate['id']))
+            friends_score = min(1, common_friends / 5)  # Нормализация
         except Exception as e:
             logger.warning(f"Couldn't compare friends: {e}")
         
-        return round(total_score, 2)
+        return group_score, friends_score
 
-    def _compare_interests(self, interests1: Dict, interests2: Dict) -> float:
+    @cached_property
+    def _searcher_interests(self) -> Dict[str, List[str]]:
+        """Интересы ищущего пользователя, разобранные и нормализованные один раз на объект."""
+        raw = self.search_params.interests if self.search_params else None
+        return _normalize_interests(orjson.loads(raw)) if raw else {}
+
+    @cached_property
+    def _searcher_social(self) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        """ID групп и друзей ищущего пользователя (один запрос execute на объект)."""
+        groups, friends = self.vk_user.get_social(self.user_id)
+        return frozenset(groups), frozenset(friends)
+
+    @property
+    def _searcher_groups(self) -> FrozenSet[int]:
+        """ID групп ищущего пользователя."""
+        return self._searcher_social[0]
+
+    @property
+    def _searcher_friends(self) -> FrozenSet[int]:
+        """ID друзей ищущего пользователя."""
+        return self._searcher_social[1]
+
+    def _candidate_groups(self, candidate_id: int) -> array:
         """
-        Сравнивает интересы двух пользователей с учетом их схожести.
+        Возвращает ID групп кандидата с кэшированием между поисками.
         
         Аргументы:
-            interests1 (Dict): Интересы первого пользователя
-            interests2 (Dict): Интересы второго пользователя
+            candidate_id (int): ID кандидата
             
         Возвращает:
-            float: Оценка схожести интересов (от 0 до 1)
+            array: ID групп кандидата
         """
-        total_score = 0
-        categories = ['interests', 'music', 'books']
+        groups = _candidate_groups_cache.get(candidate_id)
+        if groups is MISS:
+            groups = self._load_candidate_social(candidate_id)[0]
+        return groups
+
+    def _candidate_friends(self, candidate_id: int) -> array:
+        """
+        Возвращает ID друзей кандидата с кэшированием между поисками.
         
-        for category in categories:
-            items1 = [i.lower().strip() for i in interests1.get(category, []) if i.strip()]
-            items2 = [i.lower().strip() for i in interests2.get(category, []) if i.strip()]
+        Аргументы:
+            candidate_id (int): ID кандидата
             
-            if not items1 or not items2:
-                continue
-                
-            # Сравниваем каждый элемент с каждым
-            for item1 in items1:
-                for item2 in items2:
-                    similarity = SequenceMatcher(None, item1, item2).ratio()
-                    if similarity > 0.7:  # Порог схожести
-                        total_score += similarity
+        Возвращает:
+            array: ID друзей кандидата
+        """
+        friends = _candidate_friends_cache.get(candidate_id)
+        if friends is MISS:
+            friends = self._load_candidate_social(candidate_id)[1]
+        return friends
+
+    def _load_candidate_social(self, candidate_id: int) -> Tuple[array, array]:
+        """
+        Запрашивает группы и друзей кандидата одним вызовом и кладет их в кэш.
         
-        # Нормализуем оценку
-        max_possible = sum(len(v) for v in interests1.values())
-        return min(1, total_score / max_possible) if max_possible > 0 else 0
+        Аргументы:
+            candidate_id (int): ID кандидата
+            
+        Возвращает:
+            Tuple[array, array]: ID групп и ID друзей кандидата
+        """
+        groups, friends = map(_id_array, self.vk_user.get_social(candidate_id))
+        _candidate_groups_cache.set(candidate_id, groups)
+        _candidate_friends_cache.set(candidate_id, friends)
+        return groups, friends
 
-    def _get_candidate_photos(self, candidate_id: int) -> List[Dict]:
+    def _prefetch_social(self, candidate_ids: List[int]) -> None:
+        """
+        Загружает в кэш группы и друзей кандидатов пакетными запросами execute.
+        
+        Кандидаты, уже находящиеся в кэше, повторно не запрашиваются;
+        не загруженные здесь запрашиваются по одному при оценке.
+        
+        Аргументы:
+            candidate_ids (List[int]): ID кандидатов
+        """
+        for cache, fetch in (
+            (_candidate_groups_cache, self.vk_user.batch_get_groups),
+            (_candidate_friends_cache, self.vk_user.batch_get_friends)
+        ):
+            missing = [cid for cid in candidate_ids if cache.get(cid) is MISS]
+            if missing:
+                for cid, ids in fetch(missing).items():
+                    cache.set(cid, _id_array(ids))
+
+    def _get_candidate_photos(self, candidate_id: int, prefetched: Optional[List[Dict]] = None) -> List[Dict]:
         """
         Получает фотографии кандидата для отображения.
         
         Аргументы:
             candidate_id (int): ID кандидата
+            prefetched (Optional[List[Dict]]): Фото, уже полученные пакетным запросом;
+                если None, фото запрашиваются отдельно
             
         Возвращает:
             List[Dict]: Список фотографий (до 3), отсортированных по количеству лайков
         """
+        if prefetched is not None:
+            return self._top_unique_photos(prefetched)
+        
         photos = []
         try:
             photos = self.vk_photos.get_top_photos(candidate_id)
@@ -276,9 +500,35 @@ class CandidateMatcher:
         except Exception as e:
             logger.debug(f"Couldn't get tagged photos: {e}")
         
-        # Убираем дубликаты и сортируем по лайкам
-        unique_photos = {p['id']: p for p in photos}.values()
-        return sorted(unique_photos, key=lambda x: x.get('likes', 0), reverse=True)[:3]
+        return self._top_unique_photos(photos)
+
+    @staticmethod
+    def _top_unique_photos(photos: List[Dict]) -> List[Dict]:
+        """
+        Убирает повторы и оставляет три самые популярные фотографии.
+        
+        Аргументы:
+            photos (List[Dict]): Фото профиля и фото с отметками
+            
+        Возвращает:
+            List[Dict]: До трех фотографий по убыванию лайков
+        """
+        # Один проход: пропускаем дубликаты (ID фото уникален только в пределах
+        # владельца) и держим min-кучу из трех самых популярных фото
+        best = []  # (лайки, порядковый номер, фото)
+        seen = set()
+        for position, photo in enumerate(photos):
+            key = (photo['owner_id'], photo['id'])
+            if key in seen:
+                continue
+            seen.add(key)
+            # Порядковый номер со знаком минус: при равных лайках побеждает более раннее фото
+            item = (photo.get('likes', 0), -position, photo)
+            if len(best) < 3:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+        return [photo for _, _, photo in sorted(best, reverse=True)]
         
     def _cache_candidates(self, candidates: List[Dict]) -> None:
         """
@@ -287,28 +537,9 @@ class CandidateMatcher:
         Аргументы:
             candidates (List[Dict]): Список кандидатов для кэширования
         """
-        for candidate in candidates:
-            existing = self.db.query(models.Match).filter_by(
-                user_id=self.user_id,
-                matched_user_id=candidate['id']
-            ).first()
-            
-            if existing:
-                # Обновляем существующую запись
-                existing.match_score = candidate['match_score']
-                existing.photos = json.dumps(candidate['photos'])
-                existing.last_shown = datetime.now()
-            else:
-                # Создаем новую запись
-                cache_match(
-                    self.db,
-                    self.user_id,
-                    candidate['id'],
-                    candidate['photos'],
-                    candidate['match_score']
-                )
-        
-        self.db.commit()
+        # Новые кандидаты вставляются, уже известные обновляются — одним запросом.
+        # Фиксацию выполняет обработчик события вместе с остальными изменениями
+        cache_matches(self.db, self.user_id, candidates, commit=False)
 
     def get_next_candidate(self) -> Optional[Dict]:
         """
@@ -317,30 +548,100 @@ class CandidateMatcher:
         Возвращает:
             Optional[Dict]: Данные кандидата или None, если кандидатов нет
         """
-        # Сначала проверяем кэш
-        cached = self.db.query(models.Match).filter_by(
-            user_id=self.user_id
-        ).order_by(
-            models.Match.match_score.desc()
-        ).first()
-        
-        if cached:
-            return {
-                "id": cached.matched_user_id,
+        queue = _candidate_queues.get(self.user_id)
+        
+        # Первое обращение: одним запросом берем лучших закэшированных кандидатов
+        if queue is None:
+            rows = self.db.query(
+                models.Match.matched_user_id,
+                models.Match.match_score,
+                models.Match.photos
+            ).filter_by(
+                user_id=self.user_id
+            ).order_by(
+                models.Match.match_score.desc()
+            ).limit(CANDIDATE_BATCH_SIZE).all()
+            
+            queue = deque({
+                "id": matched_user_id,
                 "first_name": "",
                 "last_name": "",
                 "domain": "",
-                "match_score": cached.match_score,
-                "photos": json.loads(cached.photos)
-            }
+                "match_score": match_score,
+                "photos": photos
+            } for matched_user_id, match_score, photos in rows)
+        
+        # Пропускаем тех, кого пользователь уже заблокировал или добавил
+        # в избранное после того, как очередь была заполнена
+        excluded = get_excluded_ids(self.db, self.user_id)
+        candidate = self._pop_allowed(queue, excluded)
+        
+        # Кэш пуст или уже просмотрен — выполняем новый поиск
+        if candidate is None:
+            queue = deque(self.find_candidates())
+            candidate = self._pop_allowed(queue, excluded)
+        
+        _candidate_queues[self.user_id] = queue
+        return self.prepare_display(candidate) if candidate is not None else None
+
+    def _pop_allowed(self, queue: deque, excluded: FrozenSet[int]) -> Optional[Dict]:
+        """
+        Извлекает из очереди первого кандидата, которого не нужно пропускать.
+        
+        Аргументы:
+            queue (deque): Очередь кандидатов к показу
+            excluded (FrozenSet[int]): ID из черного списка и избранного
+            
+        Возвращает:
+            Optional[Dict]: Данные кандидата или None, если очередь исчерпана
+        """
+        while queue:
+            candidate = queue.popleft()
+            if not self._should_skip_candidate(candidate['id'], excluded):
+                return candidate
+        return None
+
+    @staticmethod
+    def reset_queue(user_id: int) -> None:
+        """
+        Сбрасывает очередь кандидатов пользователя после смены параметров поиска.
+        
+        Вместо удаления сохраняется пустая очередь: следующий показ сразу
+        выполнит новый поиск, а не поднимет из БД кандидатов, найденных
+        по старым параметрам.
         
-        # Если в кэше нет, выполняем новый поиск
-        candidates = self.find_candidates()
-        return candidates[0] if candidates else None
+        Аргументы:
+            user_id (int): ID пользователя
+        """
+        _candidate_queues[user_id] = deque()
+
+    @staticmethod
+    def prepare_display(candidate: Dict) -> Dict:
+        """
+        Один раз формирует текст сообщения и строку вложений для показа кандидата.
+        
+        Повторные показы (например, после лайка) используют готовые значения.
+        
+        Аргументы:
+            candidate (Dict): Данные кандидата
+            
+        Возвращает:
+            Dict: Тот же словарь с полями '_message' и '_attachment_str'
+        """
+        if '_message' not in candidate:
+            candidate['_message'] = (
+                f"👤 {candidate.get('first_name', '')} {candidate.get('last_name', '')}\n"
+                f"🔗 Профиль: vk.com/{candidate.get('domain', '')}\n"
+                f"💯 Совпадение: {candidate.get('match_score', 0)*100:.0f}%"
+            )
+            candidate['_attachment_str'] = ",".join(
+                f"photo{p['owner_id']}_{p['id']}" for p in candidate.get('photos') or []
+            ) or None
+        return candidate
     
     def _compare_interests(self, interests1: Dict, interests2: Dict) -> float:
         """
-        Альтернативный метод сравнения интересов с учетом весов категорий.
+        Сравнивает интересы двух пользователей с учетом весов категорий.
         
         Аргументы:
             interests1 (Dict): Интересы первого пользователя
@@ -364,9 +665,7 @@ class CandidateMatcher:
             items2 = interests2.get(category, [])
             
             if items1 and items2:
-                common = set(items1) & set(items2)
-                category_score = len(common) / max(len(items1), len(items2))
-                total_score += category_score * weight
+                total_score += _category_similarity(items1, items2) * weight
                 max_score += weight
         
         return total_score / max_score if max_score > 0 else 0
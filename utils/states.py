@@ -1,41 +1,42 @@
-from enum import Enum, auto
+from enum import IntEnum
 
 
-class BotState(str, Enum):
+class BotState(IntEnum):
     """
     Перечисление состояний бота.
     
     Каждое состояние соответствует определенному экрану или этапу взаимодействия с пользователем.
-    Наследуется от str для удобной сериализации/десериализации.
+    Наследуется от IntEnum: в БД хранится порядковый номер (SMALLINT),
+    поэтому значения существующих состояний менять нельзя.
     """
     
-    MAIN_MENU = "MAIN_MENU"
+    MAIN_MENU = 0
     """Главное меню бота"""
     
-    SEARCHING = "SEARCHING"
+    SEARCHING = 1
     """Состояние поиска кандидатов"""
     
-    VIEWING_CANDIDATE = "VIEWING_CANDIDATE"
+    VIEWING_CANDIDATE = 2
     """Просмотр профиля конкретного кандидата"""
     
-    FAVORITES = "FAVORITES"
+    FAVORITES = 3
     """Работа с избранными кандидатами"""
     
-    SEARCH_SETTINGS = "SEARCH_SETTINGS"
+    SEARCH_SETTINGS = 4
     """Настройки параметров поиска"""
     
-    PRIORITY_SETTINGS = "PRIORITY_SETTINGS"
+    PRIORITY_SETTINGS = 5
     """Настройка приоритетов при поиске"""
     
-    AUTH_IN_PROGRESS = "AUTH_IN_PROGRESS"
+    AUTH_IN_PROGRESS = 6
     """Процесс авторизации пользователя"""
     
-    AWAITING_MIN_AGE = "AWAITING_MIN_AGE"
+    AWAITING_MIN_AGE = 7
     """Ожидание ввода минимального возраста для поиска"""
     
-    AWAITING_MAX_AGE = "AWAITING_MAX_AGE"
+    AWAITING_MAX_AGE = 8
     """Ожидание ввода максимального возраста для поиска"""
     
-    AWAITING_CITY = "AWAITING_CITY"
+    AWAITING_CITY = 9
     """Ожидание ввода города для поиска"""
     
\ No newline at end of file
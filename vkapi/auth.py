@@ -5,6 +5,8 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import secrets
 import hashlib
 import base64
@@ -15,6 +17,22 @@ import time
 import logging
 
 
+# Общая HTTP-сессия: keep-alive избавляет от нового TLS-рукопожатия на каждый запрос.
+# POST обмена кода тоже повторяется: если код уже был принят, повтор
+# вернет invalid_grant — тот же итог, что и без повтора
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=None
+    )
+))
+
+
 def generate_state() -> str:
     """Генерирует уникальный state параметр для OAuth аутентификации.
 
@@ -33,8 +51,9 @@ def generate_code_verifier(length: int = 64) -> str:
     Returns:
         str: Сгенерированный code_verifier
     """
-    chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~"
-    return ''.join(secrets.choice(chars) for _ in range(length))
+    # base64url дает length символов из ceil(length * 3 / 4) случайных байт
+    # за один вызов os.urandom; алфавит [A-Za-z0-9-_] допустим для PKCE
+    return secrets.token_urlsafe(-(-length * 3 // 4))[:length]
 
 
 def generate_code_challenge(verifier: str) -> str:
@@ -106,7 +125,7 @@ def get_access_token(
             "state": state
         }
 
-        response = requests.post(
+        response = _session.post(
             "https://id.vk.com/oauth2/auth",
             data=data,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
@@ -166,7 +185,7 @@ def validate_token(token: str) -> bool:
         bool: True если токен валиден, иначе False
     """
     try:
-        response = requests.get(
+        response = _session.get(
             "https://api.vk.com/method/users.get",
             params={
                 "access_token": token,
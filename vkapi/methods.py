@@ -9,17 +9,358 @@
 
 import vk_api
 from vk_api.exceptions import ApiError
-from datetime import datetime
+from vk_api.execute import VkFunction
+from datetime import date
 from typing import Dict, List, Optional, Tuple
-import json
+import orjson
 from config import Config
+from utils.cache import MISS, LRUDict, TTLCache
 import logging
+import re
+import threading
 import time
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 from functools import lru_cache
+from operator import itemgetter
+from types import MappingProxyType
+import heapq
 
 logger = logging.getLogger(__name__)
 
+# Метод execute выполняет не более 25 обращений к API за один запрос
+EXECUTE_BATCH_SIZE = 25
+
+# Временные ошибки API, после которых запрос стоит повторить:
+# 6 — слишком много запросов в секунду, 9 — flood control, 10 — внутренняя ошибка сервера
+RETRY_ERROR_CODES = frozenset({6, 9, 10})
+
+# Поля профиля и результатов поиска (собираются один раз при импорте)
+_PROFILE_FIELDS = 'sex,bdate,city,photo_max_orig,interests,music,books,movies,tv,games,quotes,about,domain,activities'
+_SEARCH_FIELDS = 'domain,interests,music,books'
+
+# Текстовые поля профиля, разбираемые в списки интересов
+_INTEREST_KEYS = ('interests', 'music', 'books', 'movies', 'tv', 'games', 'quotes', 'about', 'activities')
+
+# Запятая вместе с окружающими пробелами разделяет элементы интересов
+_SPLIT_RE = re.compile(r'\s*,\s*')
+
+# Постоянные параметры users.search
+_SEARCH_DEFAULTS = MappingProxyType({
+    "count": 1000,
+    "status": 6,  # В активном поиске
+    "fields": _SEARCH_FIELDS,
+    "v": Config.VK_API_VERSION
+})
+
+# Ключ выбора копии фото с наибольшей высотой
+_SIZE_HEIGHT = itemgetter('height')
+
+# Данные профилей почти не меняются за время сессии в чате, а один и тот же
+# пользователь попадает в выдачу разным ищущим. Кэшируются только успешные
+# ответы: ошибка не должна прятать данные на все время жизни записи
+_profile_cache = TTLCache(maxsize=10000, ttl=300)
+_friends_cache = TTLCache(maxsize=4096, ttl=300)
+_groups_cache = TTLCache(maxsize=4096, ttl=300)
+_social_cache = TTLCache(maxsize=4096, ttl=300)
+_top_photos_cache = TTLCache(maxsize=4096, ttl=300)
+
+# Лимит API ВКонтакте для пользовательского токена: 3 запроса в секунду
+RATE_LIMIT = 3
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket.
+
+    Короткие серии запросов проходят без ожидания, пока в ведре есть
+    токены; при нехватке вызывающий поток спит ровно до появления токена.
+
+    Attributes:
+        capacity (float): Емкость ведра (максимальная серия запросов)
+        rate (float): Скорость пополнения, токенов в секунду
+        tokens (float): Доступные токены
+        last_refill (float): Время последнего пополнения (time.monotonic)
+    """
+
+    def __init__(self, capacity: float = RATE_LIMIT, rate: float = RATE_LIMIT):
+        """Инициализация ведра.
+
+        Args:
+            capacity (float): Емкость ведра
+            rate (float): Скорость пополнения, токенов в секунду
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Забирает токены, при необходимости дожидаясь пополнения.
+
+        Ожидание выполняется под блокировкой: запросы с одним токеном
+        доступа встают в очередь и не превышают общий лимит.
+
+        Args:
+            tokens (float): Количество забираемых токенов
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens < tokens:
+                time.sleep((tokens - self.tokens) / self.rate)
+                self.tokens = tokens
+                self.last_refill = time.monotonic()
+            self.tokens -= tokens
+
+
+# Лимит действует на токен доступа, поэтому ведро общее для всех
+# объектов VKUserData/VKSearch/VKPhotos с одним токеном. Ведра давно не
+# использованных токенов вытесняются: их лимит к этому времени восстановлен
+_buckets = LRUDict(maxsize=10000)
+
+
+def _get_bucket(access_token: str) -> TokenBucket:
+    """Возвращает общее ведро для токена доступа, создавая его при первом обращении.
+
+    Args:
+        access_token (str): Токен доступа к API ВКонтакте
+
+    Returns:
+        TokenBucket: Ограничитель частоты запросов для токена
+    """
+    bucket = _buckets.get(access_token)
+    if bucket is None:
+        # setdefault выполняется под блокировкой словаря: при гонке
+        # все потоки получат одно и то же ведро
+        bucket = _buckets.setdefault(access_token, TokenBucket())
+    return bucket
+
+# VKScript: ID групп для каждого пользователя из списка (пустой список,
+# если группы скрыты или запрос завершился ошибкой)
+_BATCH_GET_GROUPS = VkFunction(args=('user_ids',), code='''
+    var ids = %(user_ids)s;
+    var result = [];
+    var i = 0;
+    while (i < ids.length) {
+        var groups = API.groups.get({"user_id": ids[i], "count": 100});
+        if (groups) {
+            result.push(groups.items);
+        } else {
+            result.push([]);
+        }
+        i = i + 1;
+    }
+    return result;
+''')
+
+# VKScript: ID друзей для каждого пользователя из списка
+_BATCH_GET_FRIENDS = VkFunction(args=('user_ids',), code='''
+    var ids = %(user_ids)s;
+    var result = [];
+    var i = 0;
+    while (i < ids.length) {
+        var friends = API.friends.get({"user_id": ids[i]});
+        if (friends) {
+            result.push(friends.items);
+        } else {
+            result.push([]);
+        }
+        i = i + 1;
+    }
+    return result;
+''')
+
+# VKScript: ID групп и ID друзей одного пользователя за один запрос
+_GET_SOCIAL = VkFunction(args=('user_id',), code='''
+    var groups = API.groups.get({"user_id": %(user_id)s, "count": 100});
+    var friends = API.friends.get({"user_id": %(user_id)s});
+    var groupIds = [];
+    if (groups) {
+        groupIds = groups.items;
+    }
+    var friendIds = [];
+    if (friends) {
+        friendIds = friends.items;
+    }
+    return [groupIds, friendIds];
+''')
+
+# VKScript: для каждого пользователя пара [фото профиля, фото с отметками]
+# (по два обращения к API на пользователя)
+_BATCH_GET_PHOTOS = VkFunction(args=('user_ids',), code='''
+    var ids = %(user_ids)s;
+    var result = [];
+    var i = 0;
+    while (i < ids.length) {
+        var profile = API.photos.get({"owner_id": ids[i], "album_id": "profile", "extended": 1, "count": 200});
+        var tagged = API.photos.getUserPhotos({"user_id": ids[i], "extended": 1, "count": 3});
+        var profileItems = [];
+        if (profile) {
+            profileItems = profile.items;
+        }
+        var taggedItems = [];
+        if (tagged) {
+            taggedItems = tagged.items;
+        }
+        result.push([profileItems, taggedItems]);
+        i = i + 1;
+    }
+    return result;
+''')
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    """Проверяет, является ли исключение временной ошибкой API.
+
+    Args:
+        error (BaseException): Исключение, выброшенное при вызове
+
+    Returns:
+        bool: True для ApiError с кодом из RETRY_ERROR_CODES
+    """
+    return isinstance(error, ApiError) and error.code in RETRY_ERROR_CODES
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.5, max=4),
+    retry=retry_if_exception(_is_transient_error),
+    reraise=True
+)
+def _call_api(bucket: TokenBucket, method, *args, **params):
+    """Вызывает метод API с учетом лимита токена и повтором временных ошибок.
+
+    Каждая попытка забирает токен из ведра; после исчерпания попыток
+    выбрасывается исходное исключение, которое обрабатывает вызывающий код.
+
+    Args:
+        bucket (TokenBucket): Ограничитель частоты запросов для токена
+        method: Вызываемый метод API (например, vk.friends.get)
+        *args: Позиционные аргументы метода
+        **params: Параметры метода
+
+    Returns:
+        Any: Ответ метода API
+    """
+    bucket.acquire()
+    return method(*args, **params)
+
+
+def _parse_with_orjson(response, *args, **kwargs) -> None:
+    """Хук requests: разбирает тело ответа VK через orjson вместо json.
+
+    Ответы users.search и execute занимают сотни килобайт, и разбор
+    стандартным json заметно нагружает процессор.
+
+    Args:
+        response (requests.Response): Полученный ответ
+    """
+    response.json = lambda **_: orjson.loads(response.content)
+
+
+@lru_cache(maxsize=256)
+def _get_vk_api(access_token: str):
+    """Возвращает общий объект VK API для токена доступа.
+
+    Один VkApi на токен переиспользует requests.Session и ее пул
+    соединений с api.vk.com вместо нового TCP/TLS-соединения
+    для каждого объекта VKUserData/VKSearch/VKPhotos.
+
+    Args:
+        access_token (str): Токен доступа к API ВКонтакте
+
+    Returns:
+        VkApiMethod: Объект для вызова методов API
+    """
+    session = vk_api.VkApi(token=access_token, api_version=Config.VK_API_VERSION)
+    # Частоту запросов ограничивает общее ведро токена (TokenBucket);
+    # встроенная задержка VkApi запрещала бы короткие серии запросов
+    session.RPS_DELAY = 0
+    session.http.hooks['response'].append(_parse_with_orjson)
+    return session.get_api()
+
+
+@lru_cache(maxsize=8192)
+def _age_on(bdate: str, today_ordinal: int) -> Optional[int]:
+    """Вычисляет возраст по дате рождения на заданный день.
+
+    День входит в ключ кэша, поэтому после смены даты записи
+    перестают совпадать и возраст пересчитывается.
+
+    Args:
+        bdate (str): Дата рождения в формате DD.MM.YYYY или DD.MM
+        today_ordinal (int): Текущая дата в виде date.toordinal()
+
+    Returns:
+        Optional[int]: Возраст или None для неполной даты
+    """
+    parts = bdate.split('.')
+    if len(parts) != 3:  # Неполная дата
+        return None
+    day, month, year = map(int, parts)
+    date(year, month, day)  # Проверка существования даты
+    today = date.fromordinal(today_ordinal)
+    # Год еще не закончился, если день рождения в этом году не наступил
+    return today.year - year - ((today.month, today.day) < (month, day))
+
+
+@lru_cache(maxsize=1024)
+def _resolve_city_id(access_token: str, city_name: str) -> Optional[int]:
+    """Ищет ID города по названию с кэшированием результата.
+
+    Ошибки API пробрасываются и не попадают в кэш.
+
+    Args:
+        access_token (str): Токен доступа к API ВКонтакте
+        city_name (str): Название города в нижнем регистре без пробелов по краям
+
+    Returns:
+        Optional[int]: ID города или None, если город не найден
+    """
+    response = _call_api(
+        _get_bucket(access_token),
+        _get_vk_api(access_token).database.getCities,
+        q=city_name,
+        count=1,
+        v=Config.VK_API_VERSION
+    )
+    if response and 'items' in response and response['items']:
+        return response['items'][0]['id']
+    return None
+
+
+def _batch_execute(
+    vk,
+    bucket: TokenBucket,
+    function: VkFunction,
+    user_ids: List[int],
+    batch_size: int = EXECUTE_BATCH_SIZE
+) -> Dict[int, list]:
+    """Вызывает VKScript-функцию пачками пользователей.
+
+    Один вызов execute расходует один токен из ведра.
+
+    Args:
+        vk: Объект VK API (VkApiMethod)
+        bucket (TokenBucket): Ограничитель частоты запросов для токена
+        function (VkFunction): Функция, возвращающая список по каждому ID
+        user_ids (List[int]): ID пользователей ВКонтакте
+        batch_size (int): Число пользователей в одном вызове execute
+
+    Returns:
+        Dict[int, list]: Результат функции по ID пользователя
+            (пользователи из неудавшихся пачек отсутствуют)
+    """
+    result = {}
+    for i in range(0, len(user_ids), batch_size):
+        batch = user_ids[i:i + batch_size]
+        try:
+            result.update(zip(batch, _call_api(bucket, function, vk, batch)))
+        except Exception as e:
+            logger.error(f"Ошибка пакетного запроса execute: {e}")
+    return result
+
 
 class VKUserData:
     """Класс для работы с данными пользователя ВКонтакте.
@@ -34,12 +375,9 @@ class VKUserData:
         Args:
             access_token (str): Токен доступа к API ВКонтакте
         """
-        self.vk = vk_api.VkApi(
-            token=access_token,
-            api_version=Config.VK_API_VERSION
-        ).get_api()
-        self.last_request = 0
-        self.delay = 0.34  # ~3 запроса в секунду (лимит API)
+        self.vk = _get_vk_api(access_token)
+        self.access_token = access_token
+        self._bucket = _get_bucket(access_token)
 
     def get_friends(self, user_id: int) -> List[int]:
         """Получает список ID друзей пользователя.
@@ -50,16 +388,19 @@ class VKUserData:
         Returns:
             List[int]: Список ID друзей или пустой список при ошибке
         """
-        now = time.time()
-        if now - self.last_request < self.delay:
-            time.sleep(self.delay - (now - self.last_request))
+        friends = _friends_cache.get(user_id)
+        if friends is not MISS:
+            return friends
         
         try:
-            self.last_request = time.time()
-            return self.vk.friends.get(
+            friends = _call_api(
+                self._bucket,
+                self.vk.friends.get,
                 user_id=user_id,
                 v=Config.VK_API_VERSION
             ).get('items', [])
+            _friends_cache.set(user_id, friends)
+            return friends
         except Exception as e:
             logger.error(f"Ошибка получения списка друзей: {e}")
             return []
@@ -77,11 +418,7 @@ class VKUserData:
             return None
             
         try:
-            parts = bdate.split('.')
-            if len(parts) == 3:  # Полная дата
-                birth_date = datetime.strptime(bdate, "%d.%m.%Y")
-                return (datetime.now() - birth_date).days // 365
-            return None  # Неполная дата
+            return _age_on(bdate, date.today().toordinal())
         except (ValueError, AttributeError):
             logger.warning(f"Некорректный формат даты рождения: {bdate}")
             return None
@@ -95,16 +432,10 @@ class VKUserData:
         Returns:
             Optional[int]: ID города или None, если город не найден
         """
+        # Названия городов повторяются от поиска к поиску: регистр и
+        # пробелы по краям не влияют на ключ кэша
         try:
-            response = self.vk.database.getCities(
-                q=city_name,
-                count=1,
-                v=Config.VK_API_VERSION
-            )
-            
-            if response and 'items' in response and response['items']:
-                return response['items'][0]['id']
-            return None
+            return _resolve_city_id(self.access_token, city_name.strip().lower())
         except Exception as e:
             logger.error(f"Ошибка получения ID города '{city_name}': {e}")
             return None
@@ -118,16 +449,19 @@ class VKUserData:
         Returns:
             Optional[Dict]: Словарь с данными профиля или None при ошибке
         """
+        # Профиль владельца токена (user_id=None) не кэшируется: ключ
+        # не указывает, чей это профиль
+        if user_id:
+            profile_data = _profile_cache.get(user_id)
+            if profile_data is not MISS:
+                return profile_data
+        
         try:
-            fields = [
-                'sex', 'bdate', 'city', 'photo_max_orig',
-                'interests', 'music', 'books', 'movies', 'tv',
-                'games', 'quotes', 'about', 'domain', 'activities'
-            ]
-            
-            response = self.vk.users.get(
+            response = _call_api(
+                self._bucket,
+                self.vk.users.get,
                 user_ids=str(user_id) if user_id else '',
-                fields=','.join(fields),
+                fields=_PROFILE_FIELDS,
                 lang='ru',
                 v=Config.VK_API_VERSION
             )
@@ -159,6 +493,8 @@ class VKUserData:
             }
             
             logger.debug(f"Данные профиля пользователя {user_id}: {profile_data}")
+            if user_id:
+                _profile_cache.set(user_id, profile_data)
             return profile_data
             
         except Exception as e:
@@ -174,18 +510,13 @@ class VKUserData:
         Returns:
             Dict: Словарь с интересами пользователя по категориям
         """
-        interests = {
-            "interests": data.get('interests', '').split(',') if data.get('interests') else [],
-            "music": data.get('music', '').split(',') if data.get('music') else [],
-            "books": data.get('books', '').split(',') if data.get('books') else [],
-            "movies": data.get('movies', '').split(',') if data.get('movies') else [],
-            "tv": data.get('tv', '').split(',') if data.get('tv') else [],
-            "games": data.get('games', '').split(',') if data.get('games') else [],
-            "quotes": data.get('quotes', '').split(',') if data.get('quotes') else [],
-            "about": data.get('about', '').split(',') if data.get('about') else [],
-            "activities": data.get('activities', '').split(',') if data.get('activities') else []
+        # Одно обращение к полю; регулярное выражение сразу убирает пробелы
+        # вокруг запятых, пустые элементы отбрасываются в том же проходе
+        get = data.get
+        return {
+            key: [item for item in _SPLIT_RE.split((get(key) or '').strip()) if item]
+            for key in _INTEREST_KEYS
         }
-        return {k: [item.strip() for item in v if item.strip()] for k, v in interests.items()}
 
     def get_groups(self, user_id: int) -> List[Dict]:
         """Получает список групп пользователя.
@@ -196,19 +527,76 @@ class VKUserData:
         Returns:
             List[Dict]: Список групп или пустой список при ошибке
         """
+        groups = _groups_cache.get(user_id)
+        if groups is not MISS:
+            return groups
+        
         try:
-            response = self.vk.groups.get(
+            response = _call_api(
+                self._bucket,
+                self.vk.groups.get,
                 user_id=user_id,
                 extended=1,
                 fields='activity',
                 count=100,
                 v=Config.VK_API_VERSION
             )
-            return response.get('items', [])
+            groups = response.get('items', [])
+            _groups_cache.set(user_id, groups)
+            return groups
         except ApiError as e:
             logger.error(f"Ошибка получения списка групп: {e}")
             return []
 
+    def get_social(self, user_id: int) -> Tuple[List[int], List[int]]:
+        """Получает ID групп и ID друзей пользователя одним вызовом execute.
+
+        Args:
+            user_id (int): ID пользователя ВКонтакте
+
+        Returns:
+            Tuple[List[int], List[int]]: ID групп и ID друзей
+                (пустые списки при ошибке)
+        """
+        social = _social_cache.get(user_id)
+        if social is not MISS:
+            return social
+        
+        try:
+            groups, friends = _call_api(self._bucket, _GET_SOCIAL, self.vk, user_id)
+            social = (groups or [], friends or [])
+            _social_cache.set(user_id, social)
+            return social
+        except Exception as e:
+            logger.error(f"Ошибка получения групп и друзей: {e}")
+            return [], []
+
+    def batch_get_groups(self, user_ids: List[int]) -> Dict[int, List[int]]:
+        """Получает ID групп нескольких пользователей через execute.
+
+        Один запрос обрабатывает до EXECUTE_BATCH_SIZE пользователей.
+
+        Args:
+            user_ids (List[int]): ID пользователей ВКонтакте
+
+        Returns:
+            Dict[int, List[int]]: ID групп по ID пользователя
+                (пользователи из неудавшихся пачек отсутствуют)
+        """
+        return _batch_execute(self.vk, self._bucket, _BATCH_GET_GROUPS, user_ids)
+
+    def batch_get_friends(self, user_ids: List[int]) -> Dict[int, List[int]]:
+        """Получает ID друзей нескольких пользователей через execute.
+
+        Args:
+            user_ids (List[int]): ID пользователей ВКонтакте
+
+        Returns:
+            Dict[int, List[int]]: ID друзей по ID пользователя
+                (пользователи из неудавшихся пачек отсутствуют)
+        """
+        return _batch_execute(self.vk, self._bucket, _BATCH_GET_FRIENDS, user_ids)
+
 
 class VKSearch:
     """Класс для поиска пользователей по заданным критериям."""
@@ -219,10 +607,10 @@ class VKSearch:
         Args:
             access_token (str): Токен доступа к API ВКонтакте
         """
-        self.vk = vk_api.VkApi(token=access_token).get_api()
+        self.vk = _get_vk_api(access_token)
         self.access_token = access_token
-        self.last_request = 0
-        self.delay = 0.34  # Задержка между запросами
+        self._user_data = VKUserData(access_token)
+        self._bucket = _get_bucket(access_token)
     
     def search(self, params: Dict) -> List[Dict]:
         """Выполняет поиск пользователей по заданным параметрам.
@@ -239,31 +627,24 @@ class VKSearch:
         Returns:
             List[Dict]: Список найденных пользователей или пустой список при ошибке
         """
-        now = time.time()
-        if now - self.last_request < self.delay:
-            time.sleep(self.delay - (now - self.last_request))
-        
         try:
-            self.last_request = time.time()
-            search_params = {
-                "count": 1000,
-                "age_from": params.get("min_age", 18),
-                "age_to": params.get("max_age", 45),
-                "sex": 1 if params.get("gender") == "female" else 2,
-                "has_photo": 1 if params.get("has_photo", True) else 0,
-                "status": 6,  # Не в активном поиске
-                "fields": "photo_max_orig,domain,interests,music,books",
-                "v": Config.VK_API_VERSION
-            }
+            # Постоянные параметры берутся из шаблона, меняются только зависящие от запроса
+            search_params = dict(
+                _SEARCH_DEFAULTS,
+                age_from=params.get("min_age", 18),
+                age_to=params.get("max_age", 45),
+                sex=1 if params.get("gender") == "female" else 2,
+                has_photo=1 if params.get("has_photo", True) else 0
+            )
             
             if "city_id" in params:
                 search_params["city"] = params["city_id"]
             elif "city" in params:
-                city_id = VKUserData(self.access_token).get_city_id(params["city"])
+                city_id = self._user_data.get_city_id(params["city"])
                 if city_id:
                     search_params["city"] = city_id
             
-            response = self.vk.users.search(**search_params)
+            response = _call_api(self._bucket, self.vk.users.search, **search_params)
             items = response.get("items", [])
             
             return [
@@ -272,7 +653,6 @@ class VKSearch:
                     "first_name": user["first_name"],
                     "last_name": user["last_name"],
                     "domain": user.get("domain"),
-                    "photo": user.get("photo_max_orig"),
                     "interests": user.get("interests"),
                     "music": user.get("music"),
                     "books": user.get("books")
@@ -294,7 +674,8 @@ class VKPhotos:
         Args:
             access_token (str): Токен доступа к API ВКонтакте
         """
-        self.vk = vk_api.VkApi(token=access_token).get_api()
+        self.vk = _get_vk_api(access_token)
+        self._bucket = _get_bucket(access_token)
     
     def get_top_photos(self, user_id: int, count: int = 3) -> List[Dict]:
         """Получает топ-N фотографий профиля по количеству лайков.
@@ -306,33 +687,23 @@ class VKPhotos:
         Returns:
             List[Dict]: Список фотографий или пустой список при ошибке
         """
+        top_photos = _top_photos_cache.get((user_id, count))
+        if top_photos is not MISS:
+            return top_photos
+        
         try:
             # Получаем все фото профиля
-            photos = self.vk.photos.get(
+            photos = _call_api(
+                self._bucket,
+                self.vk.photos.get,
                 owner_id=user_id,
                 album_id="profile",
                 extended=1,
                 count=200,
                 v=Config.VK_API_VERSION
             )["items"]
-            
-            # Сортируем по количеству лайков
-            photos.sort(key=lambda x: x["likes"]["count"], reverse=True)
-            
-            # Выбираем лучшие
-            top_photos = []
-            for photo in photos[:count]:
-                # Находим фото максимального качества
-                best_size = max(photo["sizes"], key=lambda s: s["height"])
-                top_photos.append({
-                    "id": photo["id"],
-                    "owner_id": photo["owner_id"],
-                    "likes": photo["likes"]["count"],
-                    "url": best_size["url"],
-                    "width": best_size["width"],
-                    "height": best_size["height"]
-                })
-            
+            top_photos = self._top_profile_photos(photos, count)
+            _top_photos_cache.set((user_id, count), top_photos)
             return top_photos
             
         except ApiError as e:
@@ -350,23 +721,85 @@ class VKPhotos:
             List[Dict]: Список фотографий или пустой список при ошибке
         """
         try:
-            photos = self.vk.photos.getUserPhotos(
+            photos = _call_api(
+                self._bucket,
+                self.vk.photos.getUserPhotos,
                 user_id=user_id,
                 extended=1,
                 count=count,
                 v=Config.VK_API_VERSION
             ).get('items', [])
-            
-            return [{
-                'id': p['id'],
-                'owner_id': p['owner_id'],
-                'likes': p['likes']['count'] if 'likes' in p else 0,
-                'url': max(p['sizes'], key=lambda s: s['height'])['url']
-            } for p in photos]
+            return self._tagged_photos(photos)
         except Exception as e:
             logger.debug(f"Не удалось получить фотографии с отметками: {e}")
             return []
 
+    def batch_get_photos(self, user_ids: List[int], count: int = 3) -> Dict[int, List[Dict]]:
+        """Получает фото профиля и фото с отметками нескольких пользователей через execute.
+
+        На каждого пользователя приходится два обращения к API, поэтому
+        один запрос обрабатывает до EXECUTE_BATCH_SIZE // 2 пользователей.
+
+        Args:
+            user_ids (List[int]): ID пользователей ВКонтакте
+            count (int): Количество лучших фото профиля (по умолчанию 3)
+
+        Returns:
+            Dict[int, List[Dict]]: Топ-N фото профиля и фото с отметками по ID пользователя
+                (пользователи из неудавшихся пачек отсутствуют)
+        """
+        batches = _batch_execute(self.vk, self._bucket, _BATCH_GET_PHOTOS, user_ids, EXECUTE_BATCH_SIZE // 2)
+        result = {}
+        for user_id, (profile, tagged) in batches.items():
+            try:
+                result[user_id] = self._top_profile_photos(profile or [], count) + self._tagged_photos(tagged or [])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Некорректные данные фото пользователя {user_id}: {e}")
+        return result
+
+    @staticmethod
+    def _top_profile_photos(photos: List[Dict], count: int) -> List[Dict]:
+        """Выбирает топ-N фото профиля по лайкам в максимальном качестве.
+
+        Args:
+            photos (List[Dict]): Фото из ответа photos.get (extended=1)
+            count (int): Количество фотографий
+
+        Returns:
+            List[Dict]: Отобранные фотографии
+        """
+        # Выбираем лучшие по количеству лайков без полной сортировки
+        top_photos = []
+        for photo in heapq.nlargest(count, photos, key=lambda x: x["likes"]["count"]):
+            # Находим фото максимального качества
+            best_size = max(photo["sizes"], key=_SIZE_HEIGHT)
+            top_photos.append({
+                "id": photo["id"],
+                "owner_id": photo["owner_id"],
+                "likes": photo["likes"]["count"],
+                "url": best_size["url"],
+                "width": best_size["width"],
+                "height": best_size["height"]
+            })
+        return top_photos
+
+    @staticmethod
+    def _tagged_photos(photos: List[Dict]) -> List[Dict]:
+        """Приводит фото с отметками к общему формату.
+
+        Args:
+            photos (List[Dict]): Фото из ответа photos.getUserPhotos (extended=1)
+
+        Returns:
+            List[Dict]: Фотографии
+        """
+        return [{
+            'id': p['id'],
+            'owner_id': p['owner_id'],
+            'likes': p['likes']['count'] if 'likes' in p else 0,
+            'url': max(p['sizes'], key=_SIZE_HEIGHT)['url']
+        } for p in photos]
+
     def prepare_attachments(self, photos: List[Dict]) -> str:
         """Формирует строку вложений для отправки в сообщении.
         
@@ -380,7 +813,11 @@ class VKPhotos:
 
 
 class VKAuth:
-    """Класс для проверки авторизации и валидности токенов."""
+    """Класс для проверки авторизации и валидности токенов.
+
+    Результат не кэшируется: успешные проверки кэширует бот
+    (VKBot._is_token_valid) по ID пользователя.
+    """
     
     @staticmethod
     def is_token_valid(token: str) -> bool:
@@ -393,7 +830,7 @@ class VKAuth:
             bool: True если токен валиден, иначе False
         """
         try:
-            vk_api.VkApi(token=token).get_api().users.get()
+            _call_api(_get_bucket(token), _get_vk_api(token).users.get)
             return True
         except Exception as e:
             logger.error(f"Ошибка проверки токена: {str(e)}")